@@ -1,11 +1,22 @@
 """
 Kuy Eng Restaurant Application Package
 """
-from fastapi import FastAPI
+from anyio import to_thread
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from app.config import ALLOWED_ORIGINS
-from app.database import init_db
+from app.config import (
+    ALLOWED_ORIGINS, THREADPOOL_SIZE, MAX_UPLOAD_SIZE, UPLOAD_REQUEST_OVERHEAD, COMPRESSION_MIN_SIZE,
+    DATABASE_REPLICA_URLS, REPLICA_STICKY_SECONDS, ensure_directories
+)
+from app.database import REPLICA_STICKY_COOKIE, init_db, track_checkouts
+from app.middleware import (
+    RequestSizeLimitMiddleware, JSONCompressionMiddleware, MetricsMiddleware, QueryProfilingMiddleware,
+    ReplicaStickinessMiddleware
+)
+from app.services.coherence import catalog_watcher
+from app.services.image_service import image_pipeline, image_path_index
+from app.profiling import query_profiler
+from app.static_assets import static_files, admin_files
 
 def create_app():
     """Application factory"""
@@ -14,8 +25,40 @@ def create_app():
     # Initialize database on startup
     @app.on_event("startup")
     async def startup_event():
-        """Initialize database tables on startup"""
+        """Size the worker threadpool, check the schema version and index files on startup"""
+        to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+        ensure_directories()
         init_db()
+        # Follow catalog writes made by other workers
+        catalog_watcher.start()
+        image_path_index.build()
+        static_files.build()
+        admin_files.build()
+    
+    @app.on_event("shutdown")
+    async def shutdown_event():
+        """Let queued image jobs finish before exiting"""
+        image_pipeline.shutdown()
+        catalog_watcher.stop()
+    
+    # Report how many pooled connections each request checked out
+    @app.middleware("http")
+    async def count_db_checkouts(request: Request, call_next):
+        """Add an X-DB-Checkouts header to every response"""
+        with track_checkouts() as counter:
+            response = await call_next(request)
+        response.headers["X-DB-Checkouts"] = str(counter["checkouts"])
+        return response
+    
+    # Cut off oversized uploads while they are still arriving
+    app.add_middleware(
+        RequestSizeLimitMiddleware,
+        max_body=MAX_UPLOAD_SIZE + UPLOAD_REQUEST_OVERHEAD,
+        paths=["/api/upload"]
+    )
+    
+    # Compress large JSON API responses
+    app.add_middleware(JSONCompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
     
     # CORS middleware
     app.add_middleware(
@@ -26,14 +69,30 @@ def create_app():
         allow_headers=["*"],
     )
     
-    # Mount static files
-    app.mount("/static", StaticFiles(directory="static"), name="static")
-    app.mount("/assets", StaticFiles(directory="static"), name="assets")
-    app.mount("/admin", StaticFiles(directory="templates/admin", html=True), name="admin")
+    # Clients that just wrote read their own writes from the primary
+    if DATABASE_REPLICA_URLS:
+        app.add_middleware(
+            ReplicaStickinessMiddleware,
+            cookie_name=REPLICA_STICKY_COOKIE,
+            max_age=REPLICA_STICKY_SECONDS
+        )
+    
+    # Per-request SQL statistics for a sample of requests
+    if query_profiler.sample_rate > 0:
+        app.add_middleware(QueryProfilingMiddleware)
+    
+    # Outermost, so latency covers every other middleware
+    app.add_middleware(MetricsMiddleware)
     
-    # Register routes
+    # Register routes, ahead of the mounts so /static/uploads/{filename}
+    # is served from the image index rather than the /static mount
     from app.routes import frontend, admin
     app.include_router(frontend.router)
     app.include_router(admin.router)
     
+    # Mount static files
+    app.mount("/static", static_files, name="static")
+    app.mount("/assets", static_files, name="assets")
+    app.mount("/admin", admin_files, name="admin")
+    
     return app
@@ -17,6 +17,36 @@ DB_USER = os.getenv("DB_USER", "admin")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "pNuMHHoG")
 DB_NAME = os.getenv("DB_NAME", "kuyeng_restaurant")
 
+# SQLAlchemy URL of the database; the DB_* settings only build the default.
+# Any backend SQLAlchemy supports works, e.g. sqlite:///./restaurant.db for a
+# single-node deployment or for tests without MySQL.
+DATABASE_URL = os.getenv(
+    "DATABASE_URL",
+    f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+)
+# Comma-separated read replica URLs for read-only endpoints (empty: none)
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# Seconds reads stay on the primary after a write (covers replication lag)
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", 5))
+# Apply pending schema migrations at startup; when false, startup fails
+# instead and migrations are run with `python -m app.schema`
+SCHEMA_AUTO_MIGRATE = os.getenv("SCHEMA_AUTO_MIGRATE", "true").lower() in ("1", "true", "yes")
+# Seconds a starting worker waits for another one's migration to finish
+SCHEMA_LOCK_TIMEOUT = int(os.getenv("SCHEMA_LOCK_TIMEOUT", 60))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+
+# SQLite tuning (ignored by other backends): WAL lets readers run alongside a
+# writer, NORMAL sync is durable across application crashes in WAL mode, and
+# the database file is memory-mapped up to SQLITE_MMAP_SIZE bytes
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+
+# Worker threads for request handlers that call blocking database services
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", 40))
+
 # Data files (kept for backward compatibility during migration)
 DATA_DIR = os.getenv("DATA_DIR", "data")
 DATA_FILE = os.path.join(DATA_DIR, "categories.json")
@@ -25,12 +55,66 @@ MENUS_FILE = os.path.join(DATA_DIR, "menus.json")
 # Upload settings
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "static/uploads")
 MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 5 * 1024 * 1024))  # 5MB default
-ALLOWED_IMAGE_TYPES = ["image/jpeg", "image/jpg", "image/png", "image/gif", "image/webp"]
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Room for multipart boundaries and part headers around the file itself
+UPLOAD_REQUEST_OVERHEAD = 64 * 1024
+
+# Directories searched for /api/images/{filename}, first match wins
+IMAGE_DIRS = [UPLOAD_DIR, "static/images", "assets/images"]
+# Uploaded file names are never reused, so their content never changes
+UPLOADED_IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+STATIC_IMAGE_CACHE_CONTROL = os.getenv("STATIC_IMAGE_CACHE_CONTROL", "public, max-age=3600")
+PLACEHOLDER_CACHE_CONTROL = "public, max-age=300"
+# Seconds a name found in no image directory is answered without a disk lookup
+IMAGE_MISS_TTL = int(os.getenv("IMAGE_MISS_TTL", 60))
+
+# Resized image variants generated in the background after each upload
+IMAGE_VARIANT_WIDTHS = {"thumb": 160, "card": 480, "full": 1280}
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", 2))
+IMAGE_WEBP_QUALITY = int(os.getenv("IMAGE_WEBP_QUALITY", 80))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", 82))
+
+# Catalog cache settings (seconds; 0 disables caching)
+CATALOG_CACHE_TTL = int(os.getenv("CATALOG_CACHE_TTL", 300))
+CATALOG_CACHE_CONTROL = os.getenv("CATALOG_CACHE_CONTROL", "no-cache")
+# Seconds between checks of the shared catalog version, i.e. how long other
+# workers may serve a catalog older than a write (0 disables the check, for
+# single-process deployments), and change events kept for them to replay
+CATALOG_VERSION_CHECK_INTERVAL = float(os.getenv("CATALOG_VERSION_CHECK_INTERVAL", 1))
+CATALOG_CHANGE_LOG_SIZE = int(os.getenv("CATALOG_CHANGE_LOG_SIZE", 1000))
+
+# Catalog change stream (/api/catalog/stream): events buffered per client
+# before it is told to reload instead, seconds between keep-alives, seconds
+# before a stream is closed for the browser to reconnect, and open streams
+# per worker
+CATALOG_STREAM_BUFFER = int(os.getenv("CATALOG_STREAM_BUFFER", 64))
+CATALOG_STREAM_HEARTBEAT = float(os.getenv("CATALOG_STREAM_HEARTBEAT", 15))
+CATALOG_STREAM_MAX_AGE = float(os.getenv("CATALOG_STREAM_MAX_AGE", 300))
+CATALOG_STREAM_MAX_CLIENTS = int(os.getenv("CATALOG_STREAM_MAX_CLIENTS", 5000))
+
+# Bulk menu import/export
+MAX_BULK_ITEMS = int(os.getenv("MAX_BULK_ITEMS", 2000))
+EXPORT_BATCH_SIZE = 500
+
+# Static assets and response compression (bytes; smaller bodies are sent as is)
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+STATIC_CACHE_CONTROL = os.getenv("STATIC_CACHE_CONTROL", "no-cache")
+# Fingerprinted asset URLs change whenever the file does
+FINGERPRINTED_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# SQL profiling: share of requests profiled (0 disables, 1 profiles all),
+# slow-query log threshold (ms, 0 disables) and the number of identical
+# statements in one request reported as a likely N+1 pattern
+SQL_PROFILE_SAMPLE_RATE = float(os.getenv("SQL_PROFILE_SAMPLE_RATE", 0))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 0))
+REPEATED_STATEMENT_THRESHOLD = int(os.getenv("REPEATED_STATEMENT_THRESHOLD", 5))
 
 # CORS settings
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "*").split(",")
 
-# Ensure directories exist
-os.makedirs(DATA_DIR, exist_ok=True)
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-os.makedirs("static/images", exist_ok=True)
+
+def ensure_directories():
+    """Create the data and upload directories (at startup, not on import)"""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    os.makedirs("static/images", exist_ok=True)
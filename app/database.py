@@ -1,56 +1,345 @@
 """
 Database Configuration and Session Management
 """
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+from contextvars import ContextVar
+import itertools
+import threading
+import time
+from typing import Dict, List, Optional
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-# Database connection settings
-DB_HOST = os.getenv("DB_HOST", "mysql-205386-0.cloudclusters.net")
-DB_PORT = os.getenv("DB_PORT", "10048")
-DB_USER = os.getenv("DB_USER", "admin")
-DB_PASSWORD = os.getenv("DB_PASSWORD", "pNuMHHoG")
-DB_NAME = os.getenv("DB_NAME", "kuyeng_restaurant")
-
-# Create database URL
-DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-
-# Create engine with connection pool settings
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,
-    pool_recycle=3600,
-    pool_size=5,
-    max_overflow=10,
-    pool_timeout=30,
-    connect_args={
-        "connect_timeout": 10,
-        "read_timeout": 30,
-        "write_timeout": 30
-    },
-    echo=False
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
+from starlette.requests import Request
+
+from app.config import (
+    DATABASE_URL, DATABASE_REPLICA_URLS, REPLICA_STICKY_SECONDS,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, THREADPOOL_SIZE,
+    SQLITE_SYNCHRONOUS, SQLITE_MMAP_SIZE, SQLITE_BUSY_TIMEOUT_MS
 )
+from app.metrics import metrics
+from app.profiling import query_profiler
+
+# Set on responses to writes; its holder reads from the primary until it expires
+REPLICA_STICKY_COOKIE = "db-primary"
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that counts callers who gave up waiting for a connection"""
+
+    # Subclassed per engine by metered_pool(); kept when the pool is recreated
+    target = "primary"
+
+    def _do_get(self):
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            metrics.inc("db_pool_timeouts_total", (("target", self.target),))
+            raise
+
+
+def metered_pool(target: str):
+    """MeteredQueuePool class whose metrics are labelled with target"""
+    return type("MeteredQueuePool", (MeteredQueuePool,), {"target": target})
+
+
+def _configure_sqlite(dbapi_connection, connection_record):
+    """Tune every new SQLite connection for concurrent readers"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    # Enforce foreign keys as MySQL does
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def create_database_engine(url: str, target: str = "primary"):
+    """Engine for url with pool and connection settings suited to its backend"""
+    url = make_url(url)
+    backend = url.get_backend_name()
+
+    if backend == "sqlite":
+        connect_args = {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+        if url.database in (None, "", ":memory:") or url.query.get("mode") == "memory":
+            # An in-memory database lives in its connection, so share one
+            return create_engine(url, connect_args=connect_args, poolclass=StaticPool, echo=False)
+
+        # One connection per worker thread: WAL readers never block each
+        # other, so the pool should not be what makes them queue
+        engine = create_engine(
+            url,
+            poolclass=metered_pool(target),
+            pool_size=THREADPOOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            connect_args=connect_args,
+            echo=False
+        )
+        event.listen(engine, "connect", _configure_sqlite)
+        return engine
+
+    connect_args = {}
+    if backend == "mysql":
+        connect_args = {"connect_timeout": 10, "read_timeout": 30, "write_timeout": 30}
+    return create_engine(
+        url,
+        poolclass=metered_pool(target),
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        connect_args=connect_args,
+        echo=False
+    )
+
+
+# Pool checkouts made on behalf of the current request (None outside requests)
+_request_checkouts: ContextVar[Optional[Dict[str, int]]] = ContextVar("request_checkouts", default=None)
 
-# Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def _instrument(engine, target: str) -> None:
+    """Count checkouts per request and per target, and time statements"""
+    labels = (("target", target),)
+
+    @event.listens_for(engine, "checkout")
+    def _count_checkout(dbapi_connection, connection_record, connection_proxy):
+        """Attribute each pool checkout to the request that made it"""
+        metrics.inc("db_pool_checkouts_total", labels)
+        counter = _request_checkouts.get()
+        if counter is not None:
+            counter["checkouts"] += 1
+
+    # Statement timing for the slow-query log and sampled request profiles
+    query_profiler.install(engine)
+
+
+class LazySessionmaker(sessionmaker):
+    """sessionmaker whose engine is created by the first session it makes"""
+
+    def __call__(self, **local_kw) -> Session:
+        if self.kw.get("bind") is None:
+            get_engine()
+        return super().__call__(**local_kw)
+
+
+# Create session factory. Sessions live for one request, so objects are not
+# expired on commit: serializing them afterwards must not check out another
+# connection just to reload rows we already hold.
+SessionLocal = LazySessionmaker(autocommit=False, autoflush=False, expire_on_commit=False)
+# Read replicas, used by read-only endpoints through get_read_db()
+ReplicaSessions = [
+    LazySessionmaker(autocommit=False, autoflush=False, expire_on_commit=False)
+    for _ in DATABASE_REPLICA_URLS
+]
+
+# Engines are created on first use rather than at import: that loads the
+# database driver, which importing the app (scripts, tooling) must not need
+_engines: Dict[str, object] = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine():
+    """The primary engine, creating it and the replica engines on first call"""
+    engine = _engines.get("primary")
+    if engine is not None:
+        return engine
+    with _engines_lock:
+        if "primary" not in _engines:
+            replicas = [
+                create_database_engine(url, target=f"replica-{index}")
+                for index, url in enumerate(DATABASE_REPLICA_URLS)
+            ]
+            for index, (maker, replica) in enumerate(zip(ReplicaSessions, replicas)):
+                _instrument(replica, f"replica-{index}")
+                maker.configure(bind=replica)
+            engine = create_database_engine(DATABASE_URL)
+            _instrument(engine, "primary")
+            SessionLocal.configure(bind=engine)
+            _engines["replicas"] = replicas
+            _engines["primary"] = engine
+    return _engines["primary"]
+
+
+def get_replica_engines() -> List:
+    get_engine()
+    return _engines["replicas"]
+
+
+def __getattr__(name):
+    # `from app.database import engine` keeps working, creating it if needed
+    if name == "engine":
+        return get_engine()
+    if name == "replica_engines":
+        return get_replica_engines()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Create base class for models
 Base = declarative_base()
 
 
+class ReplicaRouter:
+    """Chooses the primary or a replica for read-only sessions.
+
+    Replicas are used in turn. Reads go to the primary when no replica is
+    configured, when the client wrote recently (it carries the sticky
+    cookie, so it reads its own writes) or when this process committed
+    within ``sticky_seconds``: the catalog cache is refilled right after
+    every write, and must not be refilled from a replica that has not
+    caught up yet.
+    """
+
+    def __init__(self, replica_sessions: List[sessionmaker], sticky_seconds: float):
+        self.replica_sessions = replica_sessions
+        self.sticky_seconds = sticky_seconds
+        self.last_write = 0.0
+        self.primary_reads = 0
+        self.replica_reads = 0
+        self._next = itertools.cycle(range(len(replica_sessions)))
+
+    def mark_write(self) -> None:
+        self.last_write = time.monotonic()
+
+    def session(self, sticky: bool = False) -> Session:
+        """New read-only session on the primary or the next replica"""
+        if not self.replica_sessions or sticky or time.monotonic() - self.last_write < self.sticky_seconds:
+            self.primary_reads += 1
+            return SessionLocal()
+        self.replica_reads += 1
+        return self.replica_sessions[next(self._next)]()
+
+    def stats(self) -> Dict:
+        return {
+            "replicas": len(self.replica_sessions),
+            "primaryReads": self.primary_reads,
+            "replicaReads": self.replica_reads,
+            "stickySeconds": self.sticky_seconds
+        }
+
+
+replica_router = ReplicaRouter(ReplicaSessions, REPLICA_STICKY_SECONDS)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _record_write(session):
+    """Keep reads on the primary while replicas catch up with this commit"""
+    # Only the write services commit, so every commit is a write
+    replica_router.mark_write()
+
+
+class CheckoutStats:
+    """Per-request pool checkout counters for monitoring"""
+
+    def __init__(self):
+        self.requests = 0
+        self.checkouts = 0
+        self.max_checkouts = 0
+        self.multi_checkout_requests = 0
+        self._lock = threading.Lock()
+
+    def record(self, checkouts: int) -> None:
+        """Record the checkouts made by one finished request"""
+        with self._lock:
+            self.requests += 1
+            self.checkouts += checkouts
+            self.max_checkouts = max(self.max_checkouts, checkouts)
+            if checkouts > 1:
+                self.multi_checkout_requests += 1
+
+    def stats(self) -> Dict:
+        """Counters plus the current pool state"""
+        return {
+            "requests": self.requests,
+            "checkouts": self.checkouts,
+            "avgCheckouts": round(self.checkouts / self.requests, 4) if self.requests else 0.0,
+            "maxCheckouts": self.max_checkouts,
+            "multiCheckoutRequests": self.multi_checkout_requests,
+            "pool": get_engine().pool.status(),
+            "replicaPools": [replica_engine.pool.status() for replica_engine in get_replica_engines()],
+            "routing": replica_router.stats()
+        }
+
+
+checkout_stats = CheckoutStats()
+
+
+def _pool_metrics():
+    """Pool gauges for /metrics, per target, read from the engines at scrape time"""
+    if "primary" not in _engines:
+        return
+    targets = [("primary", _engines["primary"])] + [
+        (f"replica-{index}", replica_engine) for index, replica_engine in enumerate(_engines["replicas"])
+    ]
+    gauges = [
+        ("db_pool_size", "Configured number of persistent pool connections", "size"),
+        ("db_pool_checked_out", "Pool connections currently in use", "checkedout"),
+        ("db_pool_overflow", "Connections open beyond the pool size (negative while below it)", "overflow"),
+        ("db_pool_checked_in", "Idle connections held by the pool", "checkedin")
+    ]
+    for name, help_text, method in gauges:
+        # In-memory SQLite's pool does not report every figure
+        samples = [
+            ("", (("target", target),), getattr(target_engine.pool, method)())
+            for target, target_engine in targets
+            if hasattr(target_engine.pool, method)
+        ]
+        if samples:
+            yield name, "gauge", help_text, samples
+
+
+metrics.add_collector(_pool_metrics)
+
+
+@contextmanager
+def track_checkouts():
+    """Count pool checkouts made inside the block, including worker threads"""
+    counter = {"checkouts": 0}
+    token = _request_checkouts.set(counter)
+    try:
+        yield counter
+    finally:
+        _request_checkouts.reset(token)
+        checkout_stats.record(counter["checkouts"])
+
+
 def get_db():
-    """Get database session"""
+    """Request-scoped database session (FastAPI dependency).
+
+    Every service call in a request shares this one session, so a request
+    checks out at most one pooled connection at a time. Uncommitted work is
+    rolled back if the handler fails.
+    """
     db = SessionLocal()
     try:
         yield db
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def get_read_db(request: Request):
+    """Request-scoped session for read-only endpoints (FastAPI dependency).
+
+    Bound to a read replica when one is configured and the client has not
+    written recently; otherwise to the primary, exactly like get_db().
+    """
+    db = replica_router.session(sticky=REPLICA_STICKY_COOKIE in request.cookies)
+    try:
+        yield db
+    except Exception:
+        db.rollback()
+        raise
     finally:
         db.close()
 
 
 def init_db():
-    """Initialize database - create all tables"""
-    Base.metadata.create_all(bind=engine)
+    """Bring the schema up to date; a single version query when it already is"""
+    from app.schema import ensure_schema
+    ensure_schema(get_engine())
@@ -0,0 +1,207 @@
+"""
+Index Advisor - EXPLAIN every query the services issue and flag full scans
+
+Run `python -m app.index_advisor` against a database holding a realistic
+catalog (the plans of a near-empty one say little). Each probe calls a
+read service the way the routes do, captures the statements it sends and
+asks the database for their plans. A full scan, of the table or of a
+whole index, fails the run (exit status 1) unless the probe expects one,
+such as loading the whole catalog into the cache. So does a sort the
+database has to do itself (a temporary B-tree), since paged and filtered
+reads are meant to come out of an index in order.
+
+Write paths look rows up by primary key, or by image through
+is_last_image_reference, so the read probes cover their query shapes
+without changing any data.
+"""
+import argparse
+import os
+import sys
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.config import UPLOAD_DIR
+from app.database import SessionLocal, get_engine
+from app.models.models import Category, Menu
+from app.services import catalog_service, category_service, menu_service
+
+
+@dataclass
+class Probe:
+    """A service call to explain; full_scan and sort say why either is expected"""
+    name: str
+    call: Callable[[Session], object]
+    full_scan: Optional[str] = None
+    sort: Optional[str] = None
+
+
+@dataclass
+class PlanReport:
+    probe: Probe
+    statement: str
+    plan: List[str]
+    full_scans: List[str] = field(default_factory=list)
+    sorts: List[str] = field(default_factory=list)
+
+    @property
+    def unexpected_scan(self) -> bool:
+        return bool(self.full_scans) and self.probe.full_scan is None
+
+    @property
+    def unexpected_sort(self) -> bool:
+        return bool(self.sorts) and self.probe.sort is None
+
+    @property
+    def unexpected(self) -> bool:
+        return self.unexpected_scan or self.unexpected_sort
+
+
+def probes(db: Session) -> List[Probe]:
+    """One probe per query shape, with ids taken from the catalog itself"""
+    menu = db.query(Menu.id, Menu.category_id).order_by(Menu.id).first()
+    menu_id, category_id = menu if menu else (1, 1)
+    category_id = str(category_id)
+    # Default images return before querying, so the image probe needs an upload
+    uploaded = db.query(Menu.id, Menu.image).filter(Menu.image.notin_(menu_service.DEFAULT_IMAGES)).first()
+    image_menu_id, image = uploaded if uploaded else (menu_id, os.path.join(UPLOAD_DIR, "0" * 64 + ".jpg"))
+    cursor = menu_service.encode_cursor(int(category_id), menu_id)
+    whole_catalog = "loads the whole catalog into the cache"
+
+    return [
+        Probe("categories in display order", category_service._load_categories,
+              full_scan="lists every category"),
+        Probe("category by id", lambda db: category_service.get_category_by_id(db, category_id)),
+        Probe("catalog with menu counts", catalog_service._load_catalog, full_scan=whole_catalog),
+        Probe("all menus", menu_service._load_menus, full_scan=whole_catalog),
+        Probe("menu counts per category", menu_service.query_menu_counts, full_scan="counts every menu"),
+        Probe("menu count of a category", lambda db: menu_service.count_menus_by_category(db, category_id)),
+        Probe("menu by id", lambda db: menu_service.get_menu_by_id(db, str(menu_id))),
+        Probe("menus of a category", lambda db: menu_service.query_menus(db, category_id=category_id)),
+        Probe("available menus of a category", lambda db: menu_service.query_menus(
+            db, category_id=category_id, available=True
+        )),
+        Probe("available menus of a category, next page", lambda db: menu_service.query_menus(
+            db, category_id=category_id, available=True, limit=50, cursor=cursor
+        )),
+        Probe("first page of menus", lambda db: menu_service.query_menus(db, limit=50),
+              full_scan="reads the paging index in order and stops after one page"),
+        Probe("next page of menus", lambda db: menu_service.query_menus(db, limit=50, cursor=cursor)),
+        Probe("available menus", lambda db: menu_service.query_menus(db, available=True),
+              full_scan="most menus are available"),
+        Probe("featured menus", lambda db: menu_service.query_menus(db, featured=True),
+              full_scan="a boolean is too unselective to index on its own"),
+        Probe("menus in a price range", lambda db: menu_service.query_menus(db, min_price=5000, max_price=20000),
+              full_scan="price filters are only combined with other filters in practice"),
+        Probe("other menus sharing an image",
+              lambda db: menu_service.is_last_image_reference(db, image, image_menu_id)),
+        Probe("export", lambda db: next(menu_service.iter_export_rows(db), None), full_scan="exports every menu"),
+    ]
+
+
+def capture(engine, db: Session, call: Callable[[Session], object]) -> List[Tuple[str, object]]:
+    """Statements and parameters sent while call(db) runs"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        call(db)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+        db.rollback()
+    return statements
+
+
+def explain(connection, probe: Probe, statement: str, parameters) -> PlanReport:
+    """Plan of one statement, with its full scans and sorts picked out"""
+    dialect = connection.dialect.name
+    report = PlanReport(probe=probe, statement=" ".join(statement.split()), plan=[])
+
+    if dialect == "sqlite":
+        for row in connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters):
+            detail = row[-1]
+            report.plan.append(detail)
+            # "SCAN menus" reads the table, "SCAN menus USING [COVERING] INDEX ..." a whole index
+            if detail.startswith("SCAN"):
+                report.full_scans.append(detail)
+            if "TEMP B-TREE" in detail:
+                report.sorts.append(detail)
+    elif dialect == "mysql":
+        for row in connection.exec_driver_sql("EXPLAIN " + statement, parameters).mappings():
+            line = f"{row['table']}: type={row['type']} key={row['key']} rows={row['rows']} {row['Extra'] or ''}"
+            report.plan.append(line.strip())
+            # ALL reads the table, index a whole index
+            if row["type"] in ("ALL", "index"):
+                report.full_scans.append(line)
+            if "filesort" in (row["Extra"] or ""):
+                report.sorts.append(line)
+    elif dialect == "postgresql":
+        for (line,) in connection.exec_driver_sql("EXPLAIN " + statement, parameters):
+            report.plan.append(line)
+            if "Seq Scan" in line or "Full Scan" in line:
+                report.full_scans.append(line.strip())
+            if "Sort" in line and "Key" not in line:
+                report.sorts.append(line.strip())
+    else:
+        raise ValueError(f"EXPLAIN is not supported for {dialect}")
+    return report
+
+
+def advise(engine=None) -> List[PlanReport]:
+    """Run every probe and explain each statement it issued"""
+    engine = engine or get_engine()
+    reports = []
+    db = SessionLocal()
+    try:
+        with engine.connect() as connection:
+            for probe in probes(db):
+                for statement, parameters in capture(engine, db, probe.call):
+                    reports.append(explain(connection, probe, statement, parameters))
+    finally:
+        db.close()
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN the service queries and flag full table scans")
+    parser.add_argument("--verbose", "-v", action="store_true", help="print every statement and its plan")
+    args = parser.parse_args()
+
+    engine = get_engine()
+    with SessionLocal() as db:
+        categories, menus = db.query(Category).count(), db.query(Menu).count()
+    print(f"{engine.dialect.name} database with {categories} categories and {menus} menus")
+
+    reports = advise(engine)
+    for report in reports:
+        if report.unexpected_scan:
+            verdict = "FULL SCAN"
+        elif report.unexpected_sort:
+            verdict = "SORT"
+        elif report.full_scans:
+            verdict = f"full scan, expected: {report.probe.full_scan}"
+        elif report.sorts:
+            verdict = f"sort, expected: {report.probe.sort}"
+        else:
+            verdict = "ok"
+        print(f"  {report.probe.name:<45}{verdict}")
+        if args.verbose or report.unexpected:
+            print(f"      {report.statement}")
+            for line in report.plan:
+                print(f"      | {line}")
+
+    unexpected = [report for report in reports if report.unexpected]
+    if unexpected:
+        print(f"{len(unexpected)} unexpected full scan(s) or sort(s); add an index or mark what the probe expects")
+        sys.exit(1)
+    print(f"{len(reports)} statements explained, no unexpected full scans or sorts")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Metrics - Low-overhead counters and histograms in the Prometheus text format
+"""
+import bisect
+import threading
+import weakref
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Request latency buckets in seconds (the Prometheus client defaults)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+# (name, type, help, [(sample suffix, labels, value)])
+Family = Tuple[str, str, str, List[Tuple[str, Labels, float]]]
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels:
+        value = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def _add_shard(total: Tuple[Dict, Dict], shard: Tuple[Dict, Dict]) -> None:
+    """Add a shard's counters and histograms into total"""
+    values, histograms = total
+    shard_values, shard_histograms = shard
+    # Copying under the GIL is safe while the owning thread writes
+    for key, value in list(shard_values.items()):
+        values[key] = values.get(key, 0) + value
+    for key, counts in list(shard_histograms.items()):
+        counts = list(counts)
+        existing = histograms.get(key)
+        histograms[key] = counts if existing is None else [a + b for a, b in zip(existing, counts)]
+
+
+class _ShardHolder:
+    """Thread-local owner of a shard, so its thread's end can be observed"""
+
+    __slots__ = ("shard", "__weakref__")
+
+    def __init__(self):
+        self.shard: Tuple[Dict, Dict] = ({}, {})
+
+
+class Metrics:
+    """Counters, gauges and histograms kept per thread and merged on scrape.
+
+    Each thread writes to its own dictionaries, so recording a value is a
+    dict lookup and an add with no lock taken; the lock is only used the
+    first time a thread records anything. ``render()`` sums the shards of
+    every thread. Gauges that mirror state held elsewhere (pool size, cache
+    counters) are read at scrape time by collectors registered with
+    ``add_collector``.
+
+    Worker threads come and go (anyio retires idle ones), so a thread's
+    shard is queued for retirement when the thread ends and later folded
+    into one retired total; the shard list only holds live threads.
+    """
+
+    def __init__(self):
+        self._descriptions: Dict[str, Tuple[str, str, Tuple[float, ...]]] = {}
+        self._shards: List[Tuple[Dict, Dict]] = []
+        self._retired: Tuple[Dict, Dict] = ({}, {})
+        self._ended: List[Tuple[Dict, Dict]] = []
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, kind: str, help_text: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        """Declare a metric; kind is "counter", "gauge" or "histogram" """
+        self._descriptions[name] = (kind, help_text, tuple(buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[Family]]) -> None:
+        """Register a callable producing extra metric families at scrape time"""
+        self._collectors.append(collector)
+
+    def _shard(self) -> Tuple[Dict, Dict]:
+        holder = getattr(self._local, "holder", None)
+        if holder is None:
+            holder = _ShardHolder()
+            self._local.holder = holder
+            # The thread-local value is dropped when its thread ends. The
+            # callback may run anywhere, so it only queues the shard
+            weakref.finalize(holder, self._ended.append, holder.shard)
+            with self._lock:
+                self._retire_ended()
+                self._shards.append(holder.shard)
+        return holder.shard
+
+    def _retire_ended(self) -> None:
+        """Fold the shards of ended threads into the retired total; called with the lock held"""
+        while self._ended:
+            shard = self._ended.pop()
+            self._shards = [live for live in self._shards if live is not shard]
+            _add_shard(self._retired, shard)
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1) -> None:
+        """Add value to a counter (or a gauge, with a negative value to subtract)"""
+        values = self._shard()[0]
+        key = (name, labels)
+        values[key] = values.get(key, 0) + value
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        """Record one observation in a histogram"""
+        histograms = self._shard()[1]
+        key = (name, labels)
+        counts = histograms.get(key)
+        if counts is None:
+            # One slot per bucket plus +Inf, then the running sum
+            counts = histograms[key] = [0] * (len(self._descriptions[name][2]) + 2)
+        counts[bisect.bisect_left(self._descriptions[name][2], value)] += 1
+        counts[-1] += value
+
+    def _merged(self) -> Tuple[Dict, Dict]:
+        merged: Tuple[Dict, Dict] = ({}, {})
+        with self._lock:
+            self._retire_ended()
+            shards = list(self._shards)
+            _add_shard(merged, self._retired)
+        for shard in shards:
+            _add_shard(merged, shard)
+        return merged
+
+    def families(self) -> List[Family]:
+        """Every metric family with its samples"""
+        values, histograms = self._merged()
+        samples: Dict[str, List] = {name: [] for name in self._descriptions}
+        for (name, labels), value in sorted(values.items()):
+            samples[name].append(("", labels, value))
+        for (name, labels), counts in sorted(histograms.items()):
+            buckets = self._descriptions[name][2]
+            cumulative = 0
+            for bound, count in zip(buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                samples[name].append(("_bucket", labels + (("le", le),), cumulative))
+            samples[name].append(("_sum", labels, counts[-1]))
+            samples[name].append(("_count", labels, cumulative))
+
+        families = [
+            (name, kind, help_text, samples[name])
+            for name, (kind, help_text, _) in self._descriptions.items()
+        ]
+        for collector in self._collectors:
+            families.extend(collector())
+        return families
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for name, kind, help_text, samples in self.families():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for suffix, labels, value in samples:
+                lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+metrics.describe("http_requests_total", "counter", "HTTP requests by method, route and status")
+metrics.describe("http_request_duration_seconds", "histogram", "HTTP request latency by method and route")
+metrics.describe("http_requests_in_flight", "gauge", "HTTP requests currently being served, by method")
+metrics.describe("db_pool_checkouts_total", "counter", "Connections checked out of the database pool")
+metrics.describe("db_pool_timeouts_total", "counter", "Requests that failed waiting for a pooled connection")
+metrics.describe("upload_bytes_total", "counter", "Bytes received in image uploads")
+metrics.describe("uploads_total", "counter", "Image uploads by result")
+metrics.describe("upload_duration_seconds", "histogram", "Time to receive, hash and store an image upload")
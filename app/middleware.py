@@ -0,0 +1,251 @@
+"""
+Middleware - ASGI middleware shared by the application
+"""
+import json
+import math
+import time
+from typing import Iterable
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.metrics import metrics
+from app.profiling import query_profiler
+from app.services.compression import compress_dynamic, negotiate
+
+
+class BodyTooLarge(Exception):
+    """Raised when a request body crosses the configured limit"""
+
+
+class RequestSizeLimitMiddleware:
+    """Reject request bodies larger than ``max_body`` bytes on the given paths.
+
+    Requests announcing a larger ``Content-Length`` are refused before any of
+    the body is read. Bodies without one (chunked transfer) are counted as
+    they arrive and cut off with ``413`` as soon as they cross the limit, so
+    an oversized upload is never fully received.
+    """
+
+    def __init__(self, app, max_body: int, paths: Iterable[str]):
+        self.app = app
+        self.max_body = max_body
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                try:
+                    too_large = int(value) > self.max_body
+                except ValueError:
+                    too_large = False
+                if too_large:
+                    await self._reject(send)
+                    return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body:
+                    exceeded = True
+                    raise BodyTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            # The framework reports a failed body read as its own error
+            # response; that is replaced by the 413 below
+            if exceeded:
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except BodyTooLarge:
+            pass
+        if exceeded and not response_started:
+            await self._reject(send)
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": "Request body too large"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close")
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+class JSONCompressionMiddleware:
+    """Compress JSON responses of at least ``minimum_size`` bytes.
+
+    Only ``application/json`` bodies without a Content-Encoding are touched;
+    small bodies go out as they are because compressing them costs more CPU
+    than the bytes saved. A compressed body keeps its ETag as a weak tag, so
+    If-None-Match revalidation keeps working.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        chunks = []
+
+        async def compressing_send(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if headers.get("content-type", "").startswith("application/json") \
+                        and "content-encoding" not in headers:
+                    start = message
+                    return
+            elif message["type"] == "http.response.body" and start is not None:
+                chunks.append(message.get("body", b""))
+                if message.get("more_body", False):
+                    return
+                await self._send_body(send, start, b"".join(chunks), encoding)
+                return
+            await send(message)
+
+        await self.app(scope, receive, compressing_send)
+
+    async def _send_body(self, send, start, body: bytes, encoding: str):
+        headers = MutableHeaders(raw=start["headers"])
+        headers.add_vary_header("Accept-Encoding")
+        if len(body) >= self.minimum_size:
+            body = compress_dynamic(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = f"W/{etag}"
+        await send(start)
+        await send({"type": "http.response.body", "body": body})
+
+
+def route_label(scope) -> str:
+    """The route template a request matched, so ids do not become labels"""
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if "endpoint" in scope:
+        # A mounted app (static files): label it with the mount path
+        return scope["root_path"][len(scope.get("app_root_path", "")):] or "/"
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """Record request counts, latency and in-flight requests in ``metrics``.
+
+    Latency runs until the last body chunk is sent, so streamed responses
+    are timed in full. Routes are labelled by template (``/api/menus/{menu_id}``),
+    never by the raw path.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = (("method", scope["method"]),)
+        status = 500
+
+        async def recording_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics.inc("http_requests_in_flight", method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, recording_send)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.inc("http_requests_in_flight", method, -1)
+            labels = method + (("route", route_label(scope)),)
+            metrics.inc("http_requests_total", labels + (("status", str(status)),))
+            metrics.observe("http_request_duration_seconds", labels, elapsed)
+
+
+class QueryProfilingMiddleware:
+    """Profile the SQL of a sample of requests with ``query_profiler``.
+
+    Sampled responses carry a ``Server-Timing`` header with the number of
+    statements and the time spent in the database before the response
+    started.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        profile = query_profiler.start() if scope["type"] == "http" else None
+        if profile is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def timing_send(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("Server-Timing", profile.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timing_send)
+        finally:
+            query_profiler.finish(profile, route_label(scope))
+
+
+class ReplicaStickinessMiddleware:
+    """Mark clients that just wrote so their reads stay on the primary.
+
+    Successful non-GET requests get a short-lived cookie; while the client
+    sends it back, ``get_read_db`` uses the primary instead of a replica
+    that may not have the write yet.
+    """
+
+    SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+    def __init__(self, app, cookie_name: str, max_age: float):
+        self.app = app
+        self.cookie = f"{cookie_name}=1; Max-Age={math.ceil(max_age)}; Path=/; HttpOnly; SameSite=Lax"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in self.SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def sticky_send(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                MutableHeaders(scope=message).append("Set-Cookie", self.cookie)
+            await send(message)
+
+        await self.app(scope, receive, sticky_send)
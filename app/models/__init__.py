@@ -1,6 +1,6 @@
 """
 Models package
 """
-from app.models.models import Category, Menu
+from app.models.models import Category, Menu, SchemaVersion, CatalogVersion, CatalogChange
 
-__all__ = ["Category", "Menu"]
+__all__ = ["Category", "Menu", "SchemaVersion", "CatalogVersion", "CatalogChange"]
@@ -1,7 +1,7 @@
 """
 Database Models
 """
-from sqlalchemy import Column, Integer, String, Float, Boolean, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Boolean, Text, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -9,6 +9,8 @@ from app.database import Base
 class Category(Base):
     """Category model"""
     __tablename__ = "categories"
+    # Categories are always listed in display order
+    __table_args__ = (Index("ix_categories_order", "order"),)
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     name = Column(String(255), nullable=False, unique=True)
@@ -33,6 +35,17 @@ class Category(Base):
 class Menu(Base):
     """Menu model"""
     __tablename__ = "menus"
+    __table_args__ = (
+        # Listings filter by category and availability...
+        Index("ix_menus_category_available_id", "category_id", "available", "id"),
+        # ...and page by (category_id, id), which the index above cannot
+        # return in order unless availability is fixed
+        Index("ix_menus_category_id_id", "category_id", "id"),
+        # Duplicate detection when importing
+        Index("ix_menus_title", "title"),
+        # Shared-upload checks before an image file is deleted
+        Index("ix_menus_image", "image"),
+    )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     category_id = Column(Integer, ForeignKey("categories.id", ondelete="CASCADE"), nullable=False)
@@ -64,3 +77,28 @@ class Menu(Base):
             "available": self.available,
             "featured": self.featured
         }
+
+
+class SchemaVersion(Base):
+    """Schema version stamp, maintained by app.schema"""
+    __tablename__ = "schema_version"
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+
+
+class CatalogVersion(Base):
+    """Catalog version shared by every worker (a single row), see app.services.coherence"""
+    __tablename__ = "catalog_version"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    version = Column(Integer, nullable=False, default=0)
+    # Random per database, so versions of a recreated database are never confused
+    epoch = Column(String(16), nullable=False)
+
+
+class CatalogChange(Base):
+    """Change events committed with each catalog version, replayed by other workers"""
+    __tablename__ = "catalog_changes"
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    changes = Column(Text, nullable=False)
@@ -0,0 +1,176 @@
+"""
+Query Profiling - Per-request SQL statistics, slow-query log and N+1 detection
+"""
+import heapq
+import logging
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+
+from app.config import SLOW_QUERY_MS, SQL_PROFILE_SAMPLE_RATE, REPEATED_STATEMENT_THRESHOLD
+from app.metrics import metrics
+
+logger = logging.getLogger("app.sql")
+
+# Slowest statements kept per request, and sampled requests kept for /api/db/profiles
+SLOWEST_KEPT = 5
+RECENT_PROFILES = 50
+# Statements are cut to this many characters in logs and reports
+STATEMENT_PREVIEW = 500
+
+metrics.describe("db_slow_queries_total", "counter", "Statements slower than SLOW_QUERY_MS")
+metrics.describe("db_repeated_statements_total", "counter", "Likely N+1 patterns seen in sampled requests, by route")
+
+# Profile of the sampled request being served (None when not sampled)
+_current_profile: ContextVar[Optional["QueryProfile"]] = ContextVar("query_profile", default=None)
+
+
+def _preview(statement: str) -> str:
+    statement = " ".join(statement.split())
+    return statement if len(statement) <= STATEMENT_PREVIEW else statement[:STATEMENT_PREVIEW] + "..."
+
+
+class QueryProfile:
+    """Statements executed while serving one request.
+
+    Statements are grouped by their SQL text, which carries bound parameter
+    placeholders rather than values, so the same query run for each row of
+    an earlier result (an N+1 pattern, e.g. lazily loading ``Category.menus``
+    per category) shows up as one text with a high count.
+    """
+
+    __slots__ = ("count", "total", "shapes", "slowest", "token")
+
+    def __init__(self):
+        self.token = None
+        self.count = 0
+        self.total = 0.0
+        self.shapes: Dict[str, List] = {}
+        self.slowest: List = []
+
+    def record(self, statement: str, elapsed: float) -> None:
+        self.count += 1
+        self.total += elapsed
+        shape = self.shapes.get(statement)
+        if shape is None:
+            self.shapes[statement] = [1, elapsed]
+        else:
+            shape[0] += 1
+            shape[1] += elapsed
+        entry = (elapsed, self.count, statement)
+        if len(self.slowest) < SLOWEST_KEPT:
+            heapq.heappush(self.slowest, entry)
+        elif elapsed > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def repeated(self, threshold: int) -> List[Dict]:
+        """Statement shapes executed at least threshold times"""
+        return [
+            {"statement": _preview(statement), "count": count, "ms": round(total * 1000, 3)}
+            for statement, (count, total) in self.shapes.items()
+            if count >= threshold
+        ]
+
+    def server_timing(self) -> str:
+        """Server-Timing header value"""
+        return f'db;dur={self.total * 1000:.3f};desc="{self.count} queries"'
+
+    def report(self, route: str, threshold: int) -> Dict:
+        return {
+            "route": route,
+            "queries": self.count,
+            "ms": round(self.total * 1000, 3),
+            "slowest": [
+                {"statement": _preview(statement), "ms": round(elapsed * 1000, 3)}
+                for elapsed, _, statement in sorted(self.slowest, reverse=True)
+            ],
+            "repeated": self.repeated(threshold)
+        }
+
+
+class QueryProfiler:
+    """Engine hooks plus the reports of recently sampled requests.
+
+    Listeners are only attached when profiling or the slow-query log is
+    enabled. With both on, an unsampled statement costs two
+    ``perf_counter()`` calls and a comparison.
+    """
+
+    def __init__(self, sample_rate: float, slow_query_ms: float, repeat_threshold: int):
+        self.sample_rate = sample_rate
+        self.slow_query_seconds = slow_query_ms / 1000
+        self.repeat_threshold = repeat_threshold
+        self.sampled = 0
+        self.flagged = 0
+        self._recent = deque(maxlen=RECENT_PROFILES)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 or self.slow_query_seconds > 0
+
+    def install(self, engine) -> None:
+        """Attach the timing listeners to engine when anything is enabled"""
+        if not self.enabled:
+            return
+        event.listen(engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine, "after_cursor_execute", self._after_execute)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # Kept on the statement's own context: a statement that raises never
+        # reaches after_cursor_execute, and its start must not outlive it
+        context._query_started = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_started
+        profile = _current_profile.get()
+        if profile is not None:
+            profile.record(statement, elapsed)
+        if self.slow_query_seconds and elapsed >= self.slow_query_seconds:
+            metrics.inc("db_slow_queries_total")
+            logger.warning("Slow query (%.1f ms): %s", elapsed * 1000, _preview(statement))
+
+    def start(self) -> Optional[QueryProfile]:
+        """Begin profiling the current request if it is sampled"""
+        if not self.sample_rate or (self.sample_rate < 1 and random.random() >= self.sample_rate):
+            return None
+        profile = QueryProfile()
+        profile.token = _current_profile.set(profile)
+        return profile
+
+    def finish(self, profile: QueryProfile, route: str) -> None:
+        """Store a sampled request's report and log likely N+1 patterns"""
+        _current_profile.reset(profile.token)
+        report = profile.report(route, self.repeat_threshold)
+        with self._lock:
+            self.sampled += 1
+            self._recent.append(report)
+            if report["repeated"]:
+                self.flagged += 1
+        for shape in report["repeated"]:
+            metrics.inc("db_repeated_statements_total", (("route", route),))
+            logger.warning(
+                "Statement run %d times in one request to %s (possible N+1): %s",
+                shape["count"], route, shape["statement"]
+            )
+
+    def stats(self) -> Dict:
+        """Settings, counters and the most recent sampled requests"""
+        with self._lock:
+            recent = list(self._recent)
+        return {
+            "sampleRate": self.sample_rate,
+            "slowQueryMs": self.slow_query_seconds * 1000,
+            "repeatThreshold": self.repeat_threshold,
+            "sampledRequests": self.sampled,
+            "flaggedRequests": self.flagged,
+            "recent": recent[::-1]
+        }
+
+
+query_profiler = QueryProfiler(SQL_PROFILE_SAMPLE_RATE, SLOW_QUERY_MS, REPEATED_STATEMENT_THRESHOLD)
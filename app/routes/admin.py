@@ -1,19 +1,42 @@
 """
 Admin Routes - API endpoints for admin operations
 """
-from fastapi import APIRouter, HTTPException, UploadFile, File
-from fastapi.responses import Response, FileResponse
-from pydantic import BaseModel
-from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request, Query
+from fastapi.responses import Response, FileResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Iterator, List, Optional
+import csv
+import hashlib
+import io
+import json
 import os
-import time
-from pathlib import Path
+from email.utils import formatdate, parsedate_to_datetime
+from sqlalchemy.orm import Session
 
-from app.services import category_service, menu_service
-from app.config import UPLOAD_DIR, MAX_UPLOAD_SIZE, ALLOWED_IMAGE_TYPES
+from app.services import category_service, menu_service, catalog_service, upload_service
+from app.services.cache import catalog_cache
+from app.services.change_feed import change_feed
+from app.services.compression import negotiate
+from app.services.image_service import UPLOADED_IMAGE_PREFIX, image_pipeline, image_path_index
+from app.database import REPLICA_STICKY_COOKIE, get_db, get_read_db, replica_router, checkout_stats
+from app.profiling import query_profiler
+from app.config import (
+    UPLOAD_DIR, MAX_UPLOAD_SIZE, CATALOG_CACHE_CONTROL, UPLOADED_IMAGE_CACHE_CONTROL,
+    STATIC_IMAGE_CACHE_CONTROL, PLACEHOLDER_CACHE_CONTROL, MAX_BULK_ITEMS, EXPORT_BATCH_SIZE
+)
 
+# Handlers that call the (blocking) database services are plain `def`
+# functions, so FastAPI runs them in its worker threadpool and concurrent
+# requests overlap their database round trips instead of stalling the
+# event loop. Only handlers that never touch the database are `async def`.
+# Each of them takes one request-scoped session from `get_db` (or, for
+# read-only endpoints, `get_read_db`, which may be bound to a read replica)
+# and passes it to every service call, so a request holds a single pooled
+# connection.
 router = APIRouter(prefix="/api", tags=["admin"])
 
+MAX_PAGE_SIZE = 500
+
 
 # Pydantic Models
 class Category(BaseModel):
@@ -56,54 +79,167 @@ class MenuUpdate(BaseModel):
     featured: Optional[bool] = None
 
 
+class BulkMenuItem(BaseModel):
+    action: str
+    id: Optional[str] = None
+    title: Optional[str] = None
+    categoryId: Optional[str] = None
+    description: Optional[str] = None
+    minPrice: Optional[float] = None
+    maxPrice: Optional[float] = None
+    promotionPrice: Optional[float] = None
+    currency: Optional[str] = None
+    image: Optional[str] = None
+    available: Optional[bool] = None
+    featured: Optional[bool] = None
+
+
+class BulkMenuRequest(BaseModel):
+    items: List[BulkMenuItem] = Field(..., max_length=MAX_BULK_ITEMS)
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check an If-None-Match header against a strong ETag"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
+
+
+def catalog_headers(etag: str) -> dict:
+    """Caching headers for catalog responses"""
+    return {"ETag": etag, "Cache-Control": CATALOG_CACHE_CONTROL}
+
+
+def encoded_json_response(body: bytes, encoding: Optional[str], etag: str) -> Response:
+    """A catalog body that is already JSON (and possibly compressed)"""
+    headers = catalog_headers(etag)
+    if encoding is not None:
+        # As JSONCompressionMiddleware marks the bodies it compresses
+        headers.update({"Content-Encoding": encoding, "ETag": f"W/{etag}", "Vary": "Accept-Encoding"})
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 # Image Routes
+PLACEHOLDER_SVG = b'''<svg width="400" height="300" xmlns="http://www.w3.org/2000/svg">
+        <rect width="400" height="300" fill="#e0e0e0"/>
+        <text x="50%" y="50%" text-anchor="middle" font-family="Arial, sans-serif" font-size="24" fill="#999999">No Image Available</text>
+    </svg>'''
+PLACEHOLDER_ETAG = f'"{hashlib.md5(PLACEHOLDER_SVG).hexdigest()}"'
+PLACEHOLDER_HEADERS = {"ETag": PLACEHOLDER_ETAG, "Cache-Control": PLACEHOLDER_CACHE_CONTROL}
+
+
+def is_uploaded_image(path: str) -> bool:
+    """Whether an indexed image path is an upload (stored under its content hash)"""
+    return os.path.dirname(path) == os.path.normpath(UPLOAD_DIR)
+
+
+def image_headers(path: str, stat_result: os.stat_result) -> dict:
+    """Validators and caching headers for an image file"""
+    return {
+        "ETag": f'"{int(stat_result.st_mtime):x}-{stat_result.st_size:x}"',
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": UPLOADED_IMAGE_CACHE_CONTROL if is_uploaded_image(path) else STATIC_IMAGE_CACHE_CONTROL
+    }
+
+
+def not_modified_since(request: Request, stat_result: os.stat_result) -> bool:
+    """Check an If-Modified-Since header (ignored when If-None-Match is sent)"""
+    if "if-none-match" in request.headers:
+        return False
+    since = request.headers.get("if-modified-since")
+    if not since:
+        return False
+    try:
+        return int(stat_result.st_mtime) <= parsedate_to_datetime(since).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
 @router.get("/images/{filename}")
 @router.get("/assets/images/{filename}")
 @router.get("/static/images/{filename}")
 @router.get("/static/uploads/{filename}")
-async def get_image(filename: str):
+async def get_image(filename: str, request: Request):
     """Serve image files with fallback to placeholder"""
-    # Try multiple paths
-    paths = [
-        f"static/uploads/{filename}",
-        f"static/images/{filename}",
-        f"assets/images/{filename}"
-    ]
-    
-    for path in paths:
-        if os.path.exists(path):
-            return FileResponse(path)
-    
-    # Return SVG placeholder if image not found
-    svg_placeholder = '''<svg width="400" height="300" xmlns="http://www.w3.org/2000/svg">
-        <rect width="400" height="300" fill="#e0e0e0"/>
-        <text x="50%" y="50%" text-anchor="middle" font-family="Arial, sans-serif" font-size="24" fill="#999999">No Image Available</text>
-    </svg>'''
-    return Response(content=svg_placeholder, media_type="image/svg+xml")
+    found = image_path_index.lookup(filename)
+    if found is None:
+        if etag_matches(request, PLACEHOLDER_ETAG):
+            return Response(status_code=304, headers=PLACEHOLDER_HEADERS)
+        return Response(content=PLACEHOLDER_SVG, media_type="image/svg+xml", headers=PLACEHOLDER_HEADERS)
+
+    return image_file_response(request, *found)
+
+
+def image_file_response(request: Request, path: str, stat_result: os.stat_result) -> Response:
+    """An indexed image file, or 304 when the client's copy is current"""
+    headers = image_headers(path, stat_result)
+    if etag_matches(request, headers["ETag"]) or not_modified_since(request, stat_result):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, headers=headers, stat_result=stat_result)
+
+
+# Catalog Endpoint
+@router.get("/catalog")
+def get_catalog(request: Request, db: Session = Depends(get_read_db)):
+    """Get categories (with menu counts) and menus in one response"""
+    etag = catalog_cache.etag()
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=catalog_headers(etag))
+
+    try:
+        # Encoded once per catalog version rather than on every request
+        body, encoding = catalog_service.catalog_json(db, negotiate(request.headers.get("accept-encoding")))
+        return encoded_json_response(body, encoding, etag)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to read catalog: {str(e)}")
+
+
+@router.get("/catalog/stream")
+async def stream_catalog(request: Request):
+    """Server-Sent Events feed of catalog changes for open menu pages"""
+    if change_feed.full():
+        raise HTTPException(status_code=503, detail="Too many open catalog streams", headers={"Retry-After": "30"})
+    return StreamingResponse(
+        change_feed.stream(request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        # Proxies must pass each event on as soon as it is written
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 # Category Endpoints
 @router.get("/categories")
-async def get_categories():
+def get_categories(request: Request, response: Response, db: Session = Depends(get_read_db)):
     """Get all categories with menu counts"""
+    # Take the tag before reading so a concurrent write can only make it older
+    etag = catalog_cache.etag()
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=catalog_headers(etag))
+
     try:
-        categories = category_service.read_categories()
-        menu_counts = menu_service.get_menu_counts()
+        categories = category_service.read_categories(db)
+        menu_counts = menu_service.get_menu_counts(db)
         
         # Add menu count to each category
         for category in categories:
             category["menuCount"] = menu_counts.get(category["id"], 0)
         
+        response.headers.update(catalog_headers(etag))
         return {"success": True, "categories": categories}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to read categories: {str(e)}")
 
 
 @router.post("/categories")
-async def create_category(category: Category):
+def create_category(category: Category, db: Session = Depends(get_db)):
     """Create a new category"""
     try:
         new_category = category_service.create_category(
+            db,
             name=category.name,
             description=category.description,
             order=category.order,
@@ -115,10 +251,11 @@ async def create_category(category: Category):
 
 
 @router.put("/categories/{category_id}")
-async def update_category(category_id: str, category: CategoryUpdate):
+def update_category(category_id: str, category: CategoryUpdate, db: Session = Depends(get_db)):
     """Update an existing category"""
     try:
         updated_category = category_service.update_category(
+            db,
             category_id,
             name=category.name,
             description=category.description,
@@ -137,10 +274,10 @@ async def update_category(category_id: str, category: CategoryUpdate):
 
 
 @router.delete("/categories/{category_id}")
-async def delete_category(category_id: str):
+def delete_category(category_id: str, db: Session = Depends(get_db)):
     """Delete a category"""
     try:
-        success = category_service.delete_category(category_id)
+        success = category_service.delete_category(db, category_id)
         
         if not success:
             raise HTTPException(status_code=404, detail="Category not found")
@@ -154,21 +291,115 @@ async def delete_category(category_id: str):
 
 # Menu Endpoints
 @router.get("/menus")
-async def get_menus():
-    """Get all menus"""
+def get_menus(
+    request: Request,
+    response: Response,
+    categoryId: Optional[str] = None,
+    available: Optional[bool] = None,
+    featured: Optional[bool] = None,
+    minPrice: Optional[float] = None,
+    maxPrice: Optional[float] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    """Get all menus, or a filtered page of menus when any filter is given"""
+    etag = catalog_cache.etag()
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=catalog_headers(etag))
+
+    filters = {
+        "category_id": categoryId,
+        "available": available,
+        "featured": featured,
+        "min_price": minPrice,
+        "max_price": maxPrice,
+        "limit": limit,
+        "cursor": cursor
+    }
     try:
-        menus = menu_service.read_menus()
-        categories = category_service.read_categories()
-        return {"success": True, "menus": menus, "categories": categories}
+        if any(value is not None for value in filters.values()):
+            page = menu_service.query_menus(db, **filters)
+            response.headers.update(catalog_headers(etag))
+            return {"success": True, "menus": page["menus"], "nextCursor": page["nextCursor"]}
+
+        body, encoding = catalog_service.menus_json(db, negotiate(request.headers.get("accept-encoding")))
+        return encoded_json_response(body, encoding, etag)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to read menus: {str(e)}")
 
 
+@router.post("/menus/bulk")
+def bulk_menus(request: BulkMenuRequest, db: Session = Depends(get_db)):
+    """Create, update and delete many menu items in one transaction"""
+    try:
+        # Only fields sent by the client are applied, so null can clear prices
+        items = [item.model_dump(exclude_unset=True) for item in request.items]
+        summary = menu_service.bulk_write(db, items)
+        return {"success": True, **summary}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Bulk update failed: {str(e)}")
+
+
+def stream_menu_export(fmt: str, sticky: bool = False) -> Iterator[str]:
+    """Export chunks, on a session that lives exactly as long as the stream"""
+    db = replica_router.session(sticky=sticky)
+    try:
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=menu_service.EXPORT_FIELDS, lineterminator="\n")
+        if fmt == "csv":
+            writer.writeheader()
+        rows = 0
+        for row in menu_service.iter_export_rows(db, batch_size=EXPORT_BATCH_SIZE):
+            if fmt == "csv":
+                writer.writerow(row)
+            else:
+                buffer.write(json.dumps(row, ensure_ascii=False))
+                buffer.write("\n")
+            rows += 1
+            if rows % EXPORT_BATCH_SIZE == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    finally:
+        db.close()
+
+
+@router.get("/menus/export")
+def export_menus(request: Request, format: str = Query("ndjson", pattern="^(ndjson|csv)$")):
+    """Stream every menu item as NDJSON or CSV"""
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        stream_menu_export(format, sticky=REPLICA_STICKY_COOKIE in request.cookies),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="menus.{format}"'}
+    )
+
+
+@router.get("/menus/search")
+def search_menus(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(20, ge=1, le=100),
+    categoryId: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    """Search menus by title and description"""
+    try:
+        results = menu_service.search_menus(db, q, limit=limit, category_id=categoryId)
+        return {"success": True, "query": q, "menus": results}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
+
+
 @router.post("/menus")
-async def create_menu(menu: Menu):
+def create_menu(menu: Menu, db: Session = Depends(get_db)):
     """Create a new menu item"""
     try:
         new_menu = menu_service.create_menu(
+            db,
             title=menu.title,
             category_id=menu.categoryId,
             description=menu.description,
@@ -186,10 +417,11 @@ async def create_menu(menu: Menu):
 
 
 @router.put("/menus/{menu_id}")
-async def update_menu(menu_id: str, menu: MenuUpdate):
+def update_menu(menu_id: str, menu: MenuUpdate, db: Session = Depends(get_db)):
     """Update a menu item"""
     try:
         updated_menu = menu_service.update_menu(
+            db,
             menu_id,
             title=menu.title,
             categoryId=menu.categoryId,
@@ -214,10 +446,10 @@ async def update_menu(menu_id: str, menu: MenuUpdate):
 
 
 @router.delete("/menus/{menu_id}")
-async def delete_menu(menu_id: str):
+def delete_menu(menu_id: str, db: Session = Depends(get_db)):
     """Delete a menu item"""
     try:
-        success = menu_service.delete_menu(menu_id)
+        success = menu_service.delete_menu(db, menu_id)
         
         if not success:
             raise HTTPException(status_code=404, detail="Menu not found")
@@ -227,34 +459,54 @@ async def delete_menu(menu_id: str):
         raise HTTPException(status_code=500, detail=f"Failed to delete menu: {str(e)}")
 
 
+# Cache Endpoint
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """Get catalog cache hit/miss counters"""
+    return {"success": True, "cache": catalog_cache.stats()}
+
+
+# Database Endpoint
+@router.get("/db/stats")
+async def get_db_stats():
+    """Get per-request connection checkout counters and pool state"""
+    return {"success": True, "db": checkout_stats.stats()}
+
+
+@router.get("/db/profiles")
+async def get_db_profiles():
+    """Get SQL profiles of recently sampled requests"""
+    return {"success": True, "profiling": query_profiler.stats()}
+
+
 # Upload Endpoint
+@router.get("/upload/stats")
+async def get_upload_stats():
+    """Get background image processing counters"""
+    return {"success": True, "images": image_pipeline.stats()}
+
+
 @router.post("/upload")
 async def upload_image(image: UploadFile = File(...)):
     """Upload an image file"""
     try:
-        # Validate file type
-        if image.content_type not in ALLOWED_IMAGE_TYPES:
-            raise HTTPException(
-                status_code=400,
-                detail="Invalid file type. Only JPG, PNG, GIF, and WebP are allowed"
-            )
-        
-        # Validate file size
-        contents = await image.read()
-        if len(contents) > MAX_UPLOAD_SIZE:
-            raise HTTPException(status_code=400, detail="File size exceeds 5MB limit")
-        
-        # Generate unique filename
-        extension = Path(image.filename).suffix
-        filename = f"{int(time.time() * 1000)}_{os.urandom(3).hex()}{extension}"
+        # Streamed to disk in chunks; the type comes from the file's own bytes
+        filename, created = await upload_service.save_upload(image)
         filepath = os.path.join(UPLOAD_DIR, filename)
         
-        # Save file
-        with open(filepath, "wb") as f:
-            f.write(contents)
+        # Resized variants are encoded in the background; a duplicate of a
+        # stored image already has them
+        if created:
+            image_path_index.add(filepath)
+            image_pipeline.enqueue(filepath)
         
-        return {"success": True, "imagePath": f"static/uploads/{filename}"}
-    except HTTPException:
-        raise
+        return {"success": True, "imagePath": f"{UPLOADED_IMAGE_PREFIX}{filename}"}
+    except upload_service.UnsupportedImage:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid file type. Only JPG, PNG, GIF, and WebP are allowed"
+        )
+    except upload_service.UploadTooLarge:
+        raise HTTPException(status_code=413, detail=f"File size exceeds {MAX_UPLOAD_SIZE // (1024 * 1024)}MB limit")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
@@ -1,8 +1,18 @@
 """
 Frontend Routes - Public facing pages
 """
-from fastapi import APIRouter
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import PlainTextResponse, Response
+from sqlalchemy.orm import Session
+
+from app.config import CATALOG_CACHE_CONTROL
+from app.database import get_read_db
+from app.metrics import metrics
+from app.routes.admin import etag_matches, image_file_response, is_uploaded_image
+from app.services.cache import catalog_cache
+from app.services.compression import negotiate
+from app.services.image_service import image_path_index
+from app.services.page_service import menu_page
 
 router = APIRouter(tags=["frontend"])
 
@@ -13,13 +23,49 @@ async def health_check():
     return {"status": "healthy", "service": "kuy-eng-restaurant"}
 
 
+@router.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    """Request, database pool, upload and cache metrics in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def serve_menu_page(request: Request, db: Session) -> Response:
+    """Send the pre-rendered menu page in the best encoding the client accepts"""
+    page = menu_page.get(db, catalog_cache.etag())
+    headers = {
+        "ETag": page["etag"],
+        "Cache-Control": CATALOG_CACHE_CONTROL,
+        "Vary": "Accept-Encoding"
+    }
+    if etag_matches(request, page["etag"]):
+        return Response(status_code=304, headers=headers)
+
+    encoding = negotiate(request.headers.get("accept-encoding"))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=page[encoding or "identity"], media_type="text/html", headers=headers)
+
+
 @router.get("/")
-async def read_root():
+def read_root(request: Request, db: Session = Depends(get_read_db)):
     """Serve the main menu page"""
-    return FileResponse("templates/frontend/index.html")
+    return serve_menu_page(request, db)
 
 
 @router.get("/index.html")
-async def read_index():
+def read_index(request: Request, db: Session = Depends(get_read_db)):
     """Serve the main menu page"""
-    return FileResponse("templates/frontend/index.html")
+    return serve_menu_page(request, db)
+
+
+@router.api_route("/static/uploads/{filename}", methods=["GET", "HEAD"])
+async def read_uploaded_image(filename: str, request: Request):
+    """Serve an uploaded image (or variant) from the image index.
+
+    These are the image URLs the menu page loads. Unknown names are a 404,
+    as from the static mount, so the page's fallback image shows.
+    """
+    found = image_path_index.lookup(filename)
+    if found is None or not is_uploaded_image(found[0]):
+        raise HTTPException(status_code=404, detail="Image not found")
+    return image_file_response(request, *found)
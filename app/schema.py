@@ -0,0 +1,179 @@
+"""
+Schema - Versioned migrations, checked with a single query at startup
+
+Run `python -m app.schema` to apply pending migrations (for deployments that
+set SCHEMA_AUTO_MIGRATE=false), or `python -m app.schema --check` to print
+the stamped and expected versions.
+"""
+import argparse
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, List, Tuple
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import DBAPIError, OperationalError
+
+from app.config import SCHEMA_AUTO_MIGRATE, SCHEMA_LOCK_TIMEOUT
+from app.database import Base, get_engine
+from app.models.models import Category, Menu, SchemaVersion, CatalogVersion, CatalogChange
+
+logger = logging.getLogger("app.schema")
+
+# Named lock (MySQL) and advisory lock key (PostgreSQL) held while migrating
+LOCK_NAME = "schema_migrate"
+LOCK_KEY = 0x5c4e3a
+
+
+class SchemaOutOfDate(RuntimeError):
+    """Raised at startup when migrations are pending and auto-migration is off"""
+
+
+def _baseline(connection) -> None:
+    """The tables create_all() made before schema versioning; existing ones are kept"""
+    Base.metadata.create_all(connection, tables=[Category.__table__, Menu.__table__])
+
+
+def _access_pattern_indexes(connection) -> None:
+    """Indexes for the category listing, menu listings, imports and image checks.
+
+    A database created at this release already has them from the baseline's
+    create_all(), so each one is only created when missing.
+    """
+    for table in (Category.__table__, Menu.__table__):
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def _catalog_version(connection) -> None:
+    """Shared catalog version and change log, so every worker sees every write"""
+    Base.metadata.create_all(connection, tables=[CatalogVersion.__table__, CatalogChange.__table__])
+    if connection.execute(select(CatalogVersion.id)).first() is None:
+        connection.execute(insert(CatalogVersion).values(id=1, version=0, epoch=os.urandom(4).hex()))
+
+
+def _paging_index(connection) -> None:
+    """Index returning menus in (category_id, id) order for keyset pages"""
+    for index in Menu.__table__.indexes:
+        if index.name == "ix_menus_category_id_id":
+            index.create(connection, checkfirst=True)
+
+
+# (version, description, upgrade) in order. Append new steps; never edit one
+# that has shipped, since stamped databases will not run it again.
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "categories and menus tables", _baseline),
+    (2, "indexes for menu and category access patterns", _access_pattern_indexes),
+    (3, "shared catalog version and change log", _catalog_version),
+    (4, "menu index in paging order", _paging_index),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(engine) -> int:
+    """Stamped schema version, 0 for a database that was never stamped"""
+    try:
+        with engine.connect() as connection:
+            return connection.execute(select(SchemaVersion.version)).scalar() or 0
+    except DBAPIError:
+        # No schema_version table yet
+        return 0
+
+
+def _begin_immediate(connection) -> None:
+    """Take SQLite's write lock, retrying past the busy timeout while another worker migrates"""
+    deadline = time.monotonic() + SCHEMA_LOCK_TIMEOUT
+    while True:
+        try:
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+            return
+        except OperationalError as e:
+            if "locked" not in str(e) or time.monotonic() > deadline:
+                raise
+            connection.rollback()
+
+
+@contextmanager
+def migration_lock(engine):
+    """A connection holding the database-wide migration lock, committed on exit.
+
+    Workers starting together on a fresh database would otherwise race
+    through the steps: create(checkfirst=True) checks and then creates,
+    and MySQL commits each DDL statement on its own, so a transaction
+    cannot stand in for the lock. SQLite takes its write lock with BEGIN
+    IMMEDIATE; MySQL and PostgreSQL use a named session lock that survives
+    DDL commits. Other workers wait up to ``SCHEMA_LOCK_TIMEOUT`` seconds.
+    """
+    with engine.connect() as connection:
+        dialect = connection.dialect.name
+        if dialect == "sqlite":
+            _begin_immediate(connection)
+        elif dialect == "mysql":
+            acquired = connection.exec_driver_sql(
+                "SELECT GET_LOCK(%s, %s)", (LOCK_NAME, SCHEMA_LOCK_TIMEOUT)
+            ).scalar()
+            if acquired != 1:
+                raise SchemaOutOfDate(f"Timed out after {SCHEMA_LOCK_TIMEOUT}s waiting for the migration lock")
+        elif dialect == "postgresql":
+            connection.exec_driver_sql("SELECT pg_advisory_lock(%s)", (LOCK_KEY,))
+        try:
+            yield connection
+            connection.commit()
+        finally:
+            if dialect == "mysql":
+                connection.exec_driver_sql("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+            elif dialect == "postgresql":
+                connection.exec_driver_sql("SELECT pg_advisory_unlock(%s)", (LOCK_KEY,))
+
+
+def migrate(engine, target: int = SCHEMA_VERSION) -> int:
+    """Apply the migrations after the stamped version up to target.
+
+    Runs under migration_lock(). The stamp is read again once the lock is
+    held, so a worker that waited on another one's migration finds the
+    steps applied and skips them.
+    """
+    with migration_lock(engine) as connection:
+        SchemaVersion.__table__.create(connection, checkfirst=True)
+        version = connection.execute(select(SchemaVersion.version)).scalar() or 0
+        for step, description, upgrade in MIGRATIONS:
+            if version < step <= target:
+                logger.info("Migrating schema to version %d: %s", step, description)
+                upgrade(connection)
+                connection.execute(delete(SchemaVersion))
+                connection.execute(insert(SchemaVersion).values(version=step))
+                version = step
+    return version
+
+
+def ensure_schema(engine) -> None:
+    """Startup check: one query when the schema is current, migrations otherwise"""
+    version = current_version(engine)
+    if version == SCHEMA_VERSION:
+        return
+    if version > SCHEMA_VERSION:
+        # A newer release migrated this database; keep serving during its rollout
+        logger.warning("Database schema version %d is newer than this release (%d)", version, SCHEMA_VERSION)
+        return
+    if not SCHEMA_AUTO_MIGRATE:
+        raise SchemaOutOfDate(
+            f"Database schema is at version {version}, expected {SCHEMA_VERSION}; run `python -m app.schema`"
+        )
+    migrate(engine)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations")
+    parser.add_argument("--check", action="store_true", help="only print the stamped and expected versions")
+    args = parser.parse_args()
+
+    engine = get_engine()
+    version = current_version(engine)
+    print(f"Schema version: {version} (expected {SCHEMA_VERSION})")
+    if not args.check and version < SCHEMA_VERSION:
+        print(f"Migrated to version {migrate(engine)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Catalog Cache - In-process read-through cache for catalog reads
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from app.config import CATALOG_CACHE_TTL
+from app.metrics import metrics
+
+
+class CatalogCache:
+    """Read-through cache for catalog data, invalidated by every write.
+
+    Entries are keyed by name (e.g. "menus", "categories") and expire after
+    ``ttl`` seconds as a safety net. Writers call ``invalidate()`` after
+    committing, which drops every entry and bumps ``version``. A load that
+    started before an invalidation is never stored, so a slow reader cannot
+    put stale rows back into the cache.
+
+    ``etag()`` combines the version with a per-process token so that two
+    processes (or a restarted one) never hand out the same tag for
+    different data. Once ``sync()`` adopts the shared catalog version
+    (app.services.coherence), the token is the database's and every worker
+    hands out the same tag for the same catalog.
+
+    ``invalidate()`` without a version (a change that could not be given a
+    shared version) bumps a separate local counter instead, which puts this
+    process's own token back into the tag. A later shared version can then
+    never produce a tag already handed out for other data.
+    """
+
+    def __init__(self, ttl: int = 300):
+        self.ttl = ttl
+        self.version = 1
+        self.local = 0
+        self.instance = os.urandom(4).hex()
+        self._process = self.instance
+        # Bumped by every invalidation, so loads that started before one are not stored
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str, loader: Callable[[], Any]) -> Any:
+        """Return the cached value for key, calling loader on a miss"""
+        if self.ttl > 0:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+
+        self.misses += 1
+        generation = self._generation
+        value = loader()
+
+        if self.ttl > 0:
+            with self._lock:
+                if generation == self._generation:
+                    self._entries[key] = (time.monotonic() + self.ttl, value)
+        return value
+
+    def invalidate(self, version: Optional[int] = None) -> None:
+        """Drop all entries and move to the shared version, or bump the local counter without one"""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            if version is None:
+                self.local += 1
+            else:
+                self.version = max(self.version, version)
+
+    def sync(self, instance: str, version: int) -> None:
+        """Adopt the shared catalog version and its database token"""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self.instance = instance
+            self.version = version
+
+    def etag(self) -> str:
+        """Strong ETag for the current catalog version"""
+        if self.local:
+            return f'"{self.instance}-{self.version}-{self._process}.{self.local}"'
+        return f'"{self.instance}-{self.version}"'
+
+    def stats(self) -> Dict:
+        """Hit/miss counters for monitoring"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRatio": round(self.hits / total, 4) if total else 0.0,
+            "entries": len(self._entries),
+            "version": self.version,
+            "ttl": self.ttl
+        }
+
+    def metric_families(self):
+        """Hit/miss counters and hit ratio for /metrics"""
+        stats = self.stats()
+        yield "catalog_cache_hits_total", "counter", "Catalog cache hits", [("", (), stats["hits"])]
+        yield "catalog_cache_misses_total", "counter", "Catalog cache misses", [("", (), stats["misses"])]
+        yield "catalog_cache_hit_ratio", "gauge", "Share of catalog reads served from cache", [("", (), stats["hitRatio"])]
+
+
+catalog_cache = CatalogCache(ttl=CATALOG_CACHE_TTL)
+metrics.add_collector(catalog_cache.metric_families)
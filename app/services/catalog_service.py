@@ -0,0 +1,93 @@
+"""
+Catalog Service - Combined category and menu reads for the public menu
+"""
+from typing import Callable, Dict, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.config import COMPRESSION_MIN_SIZE
+from app.models.models import Category, Menu
+from app.services import category_service, menu_service
+from app.services.cache import catalog_cache
+from app.services.compression import compress_dynamic
+from app.services.serialization import encode, json_object, menu_fragments
+
+
+def _load_catalog(db: Session) -> Dict:
+    """Load categories (with menu counts) and menus"""
+    counts = (
+        db.query(Menu.category_id, func.count(Menu.id).label("menu_count"))
+        .group_by(Menu.category_id)
+        .subquery()
+    )
+    rows = (
+        db.query(Category, func.coalesce(counts.c.menu_count, 0))
+        .outerjoin(counts, counts.c.category_id == Category.id)
+        .order_by(Category.order)
+        .all()
+    )
+    categories = []
+    for category, menu_count in rows:
+        data = category.to_dict()
+        data["menuCount"] = menu_count
+        categories.append(data)
+
+    menus = [menu_service.serialize_menu(menu) for menu in db.query(Menu).all()]
+    return {"categories": categories, "menus": menus}
+
+
+def read_catalog(db: Session) -> Dict:
+    """Read the full catalog (served from the catalog cache)"""
+    catalog = catalog_cache.get("catalog", lambda: _load_catalog(db))
+    return {
+        "categories": [dict(cat) for cat in catalog["categories"]],
+        "menus": [dict(menu) for menu in catalog["menus"]]
+    }
+
+
+def _cached_body(key: str, build: Callable[[], bytes], encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """A cached response body and the Content-Encoding it is in.
+
+    The JSON and each compressed copy are stored in the catalog cache, so
+    they are built once per catalog version. Bodies under
+    ``COMPRESSION_MIN_SIZE`` are sent uncompressed.
+    """
+    body = catalog_cache.get(key, build)
+    if encoding is None or len(body) < COMPRESSION_MIN_SIZE:
+        return body, None
+    return catalog_cache.get(f"{key}.{encoding}", lambda: compress_dynamic(body, encoding)), encoding
+
+
+def _version() -> bytes:
+    # Read inside the build, so a body is only cached with the version it was built under
+    return encode(catalog_cache.etag().strip('"'))
+
+
+def catalog_json(db: Session, encoding: Optional[str] = None) -> Tuple[bytes, Optional[str]]:
+    """The GET /api/catalog body, encoded once per catalog version"""
+
+    def build() -> bytes:
+        version = _version()
+        catalog = catalog_cache.get("catalog", lambda: _load_catalog(db))
+        return json_object([
+            ("success", b"true"),
+            ("categories", encode(catalog["categories"])),
+            ("menus", menu_fragments.array(catalog["menus"])),
+            ("version", version)
+        ])
+
+    return _cached_body("catalog.json", build, encoding)
+
+
+def menus_json(db: Session, encoding: Optional[str] = None) -> Tuple[bytes, Optional[str]]:
+    """The unfiltered GET /api/menus body, encoded once per catalog version"""
+
+    def build() -> bytes:
+        menus = catalog_cache.get("menus", lambda: menu_service._load_menus(db))
+        categories = catalog_cache.get("categories", lambda: category_service._load_categories(db))
+        return json_object([
+            ("success", b"true"),
+            ("menus", menu_fragments.array(menus)),
+            ("categories", encode(categories))
+        ])
+
+    return _cached_body("menus.json", build, encoding)
@@ -4,96 +4,81 @@ Category Service - Business logic for category operations
 from typing import List, Dict, Optional
 from sqlalchemy.orm import Session
 from app.models.models import Category
-from app.database import SessionLocal
+from app.services.cache import catalog_cache
+from app.services.change_feed import changed_fields
+from app.services.coherence import change, commit_catalog_write
 
 
-def get_db_session() -> Session:
-    """Get database session"""
-    return SessionLocal()
+def _load_categories(db: Session) -> List[Dict]:
+    """Load all categories from database"""
+    categories = db.query(Category).order_by(Category.order).all()
+    return [cat.to_dict() for cat in categories]
 
 
-def read_categories() -> List[Dict]:
-    """Read all categories from database"""
-    db = get_db_session()
-    try:
-        categories = db.query(Category).order_by(Category.order).all()
-        return [cat.to_dict() for cat in categories]
-    finally:
-        db.close()
+def read_categories(db: Session) -> List[Dict]:
+    """Read all categories (served from the catalog cache)"""
+    categories = catalog_cache.get("categories", lambda: _load_categories(db))
+    return [dict(cat) for cat in categories]
 
 
-def get_category_by_id(category_id: str) -> Optional[Dict]:
+def get_category_by_id(db: Session, category_id: str) -> Optional[Dict]:
     """Get a single category by ID"""
-    db = get_db_session()
-    try:
-        category = db.query(Category).filter(Category.id == int(category_id)).first()
-        return category.to_dict() if category else None
-    finally:
-        db.close()
+    category = db.query(Category).filter(Category.id == int(category_id)).first()
+    return category.to_dict() if category else None
 
 
-def create_category(name: str, description: str = "", order: int = 0, active: bool = True) -> Dict:
+def create_category(db: Session, name: str, description: str = "", order: int = 0,
+                    active: bool = True) -> Dict:
     """Create a new category"""
-    db = get_db_session()
-    try:
-        new_category = Category(
-            name=name,
-            description=description,
-            order=order,
-            active=active
-        )
-        db.add(new_category)
-        db.commit()
-        db.refresh(new_category)
-        return new_category.to_dict()
-    finally:
-        db.close()
+    new_category = Category(
+        name=name,
+        description=description,
+        order=order,
+        active=active
+    )
+    db.add(new_category)
+    db.flush()
+    category = new_category.to_dict()
+    commit_catalog_write(db, [change("category", "created", category["id"], category)])
+    return category
 
 
-def update_category(category_id: str, **kwargs) -> Optional[Dict]:
+def update_category(db: Session, category_id: str, **kwargs) -> Optional[Dict]:
     """Update an existing category"""
-    db = get_db_session()
-    try:
-        category = db.query(Category).filter(Category.id == int(category_id)).first()
-        
-        if not category:
-            return None
-        
-        if "name" in kwargs and kwargs["name"] is not None:
-            category.name = kwargs["name"]
-        if "description" in kwargs and kwargs["description"] is not None:
-            category.description = kwargs["description"]
-        if "order" in kwargs and kwargs["order"] is not None:
-            category.order = kwargs["order"]
-        if "active" in kwargs and kwargs["active"] is not None:
-            category.active = kwargs["active"]
-        
-        db.commit()
-        db.refresh(category)
-        return category.to_dict()
-    finally:
-        db.close()
+    category = db.query(Category).filter(Category.id == int(category_id)).first()
+    
+    if not category:
+        return None
+    
+    before = category.to_dict()
+    if "name" in kwargs and kwargs["name"] is not None:
+        category.name = kwargs["name"]
+    if "description" in kwargs and kwargs["description"] is not None:
+        category.description = kwargs["description"]
+    if "order" in kwargs and kwargs["order"] is not None:
+        category.order = kwargs["order"]
+    if "active" in kwargs and kwargs["active"] is not None:
+        category.active = kwargs["active"]
+    
+    updated = category.to_dict()
+    commit_catalog_write(db, [change("category", "updated", updated["id"], changed_fields(before, updated))])
+    return updated
 
 
-def delete_category(category_id: str) -> bool:
+def delete_category(db: Session, category_id: str) -> bool:
     """Delete a category"""
     from app.services.menu_service import count_menus_by_category
     
     # Check if any menus use this category
-    menu_count = count_menus_by_category(category_id)
+    menu_count = count_menus_by_category(db, category_id)
     if menu_count > 0:
         raise ValueError(f"Cannot delete category. {menu_count} menu item(s) are using this category.")
     
-    db = get_db_session()
-    try:
-        category = db.query(Category).filter(Category.id == int(category_id)).first()
-        
-        if not category:
-            return False
-        
-        db.delete(category)
-        db.commit()
-        return True
-    finally:
-        db.close()
-
+    category = db.query(Category).filter(Category.id == int(category_id)).first()
+    
+    if not category:
+        return False
+    
+    db.delete(category)
+    commit_catalog_write(db, [change("category", "deleted", category_id)])
+    return True
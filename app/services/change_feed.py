@@ -0,0 +1,217 @@
+"""
+Change Feed - Catalog change events pushed to open pages over Server-Sent Events
+"""
+import asyncio
+import json
+import os
+import threading
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+from app.config import (
+    CATALOG_STREAM_BUFFER, CATALOG_STREAM_HEARTBEAT, CATALOG_STREAM_MAX_AGE, CATALOG_STREAM_MAX_CLIENTS
+)
+from app.metrics import metrics
+from app.services.cache import catalog_cache
+
+# Browsers wait this long (ms) before reconnecting a closed stream
+RETRY_MS = 3000
+HEARTBEAT = b": keep-alive\n\n"
+
+
+def changed_fields(before: Dict, after: Dict) -> Dict:
+    """Fields of after whose values differ from before"""
+    return {field: value for field, value in after.items() if before.get(field) != value}
+
+
+def sse_frame(event: str, data: Dict, event_id: Optional[str] = None) -> bytes:
+    """One Server-Sent Events message"""
+    lines = f"id: {event_id}\n" if event_id else ""
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return f"{lines}event: {event}\ndata: {payload}\n\n".encode("utf-8")
+
+
+class ChangeEvent:
+    """A published change, encoded once for every subscriber"""
+
+    __slots__ = ("sequence", "frame")
+
+    def __init__(self, sequence: int, frame: bytes):
+        self.sequence = sequence
+        self.frame = frame
+
+
+class Subscription:
+    """Events waiting to be sent to one client.
+
+    Only touched from the event loop. At most ``size`` events are held; a
+    client that falls further behind has its backlog dropped and is told to
+    reload the catalog instead, so a slow phone never holds memory for
+    every write.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.pending: deque = deque()
+        self.overflowed = False
+        self.last_sequence = 0
+        self.wakeup = asyncio.Event()
+
+    def push(self, event: ChangeEvent) -> None:
+        if event.sequence <= self.last_sequence or self.overflowed:
+            return
+        if len(self.pending) >= self.size:
+            self.pending.clear()
+            self.overflowed = True
+            metrics.inc("catalog_stream_overflows_total")
+        else:
+            self.pending.append(event)
+        self.wakeup.set()
+
+    async def next(self, timeout: float) -> Optional[List[ChangeEvent]]:
+        """Pending events (empty after an overflow), or None after timeout idle seconds"""
+        if not self.pending and not self.overflowed:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        self.wakeup.clear()
+        events = list(self.pending)
+        self.pending.clear()
+        if events:
+            self.last_sequence = events[-1].sequence
+        return events
+
+
+class ChangeFeed:
+    """Fans catalog writes out to every open ``/api/catalog/stream``.
+
+    Services call ``publish()`` after committing, usually from a worker
+    thread. The event is encoded once and handed to the event loop in a
+    single callback, which appends it to each subscriber's bounded buffer,
+    so a write costs the same whether ten or ten thousand pages are open.
+
+    The last ``buffer_size`` events are kept so a reconnecting browser (which
+    sends ``Last-Event-ID``) is replayed what it missed. Event ids carry a
+    per-process token: a client that reconnects to another worker, or
+    missed more than the history holds, is told to reload the catalog.
+    """
+
+    def __init__(self, buffer_size: int = 64, heartbeat: float = 15.0,
+                 max_age: float = 300.0, max_clients: int = 5000):
+        self.buffer_size = buffer_size
+        self.heartbeat = heartbeat
+        self.max_age = max_age
+        self.max_clients = max_clients
+        self.instance = os.urandom(4).hex()
+        self.sequence = 0
+        self.published = 0
+        self._history: deque = deque(maxlen=buffer_size)
+        self._subscribers: Set[Subscription] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def publish(self, kind: str, action: str, item_id: Optional[str] = None,
+                changes: Optional[Dict] = None) -> None:
+        """Announce a committed change (kind "menu"/"category", or "catalog" for a reload)"""
+        data = {"type": kind, "action": action, "version": catalog_cache.etag().strip('"')}
+        if item_id is not None:
+            data["id"] = str(item_id)
+        if changes:
+            data["changes"] = changes
+        with self._lock:
+            self.sequence += 1
+            self.published += 1
+            event_id = f"{self.instance}-{self.sequence}"
+            event = ChangeEvent(self.sequence, sse_frame("reset" if kind == "catalog" else "change", data, event_id))
+            self._history.append(event)
+            loop = self._loop
+        if loop is not None and self._subscribers:
+            try:
+                loop.call_soon_threadsafe(self._fan_out, event)
+            except RuntimeError:
+                # The event loop has closed
+                pass
+
+    def reset(self) -> None:
+        """Tell every client to reload the catalog (changes too many to describe)"""
+        self.publish("catalog", "reload")
+
+    def _fan_out(self, event: ChangeEvent) -> None:
+        for subscription in self._subscribers:
+            subscription.push(event)
+
+    def full(self) -> bool:
+        return len(self._subscribers) >= self.max_clients
+
+    def _replay(self, subscription: Subscription, last_event_id: Optional[str]) -> bool:
+        """Queue the events after last_event_id; False if they are no longer held"""
+        instance, _, sequence = (last_event_id or "").rpartition("-")
+        if instance != self.instance or not sequence.isdigit():
+            return False
+        sequence = int(sequence)
+        with self._lock:
+            history = list(self._history)
+            current = self.sequence
+        if sequence > current or (sequence < current and (not history or history[0].sequence > sequence + 1)):
+            return False
+        subscription.last_sequence = sequence
+        for event in history:
+            subscription.push(event)
+        return True
+
+    async def stream(self, last_event_id: Optional[str] = None) -> AsyncIterator[bytes]:
+        """SSE body for one client: "ready" or a replay, then changes and heartbeats.
+
+        The stream ends after ``max_age`` seconds; the browser reconnects
+        with Last-Event-ID and misses nothing, and a restarting worker is
+        not kept waiting on connections that never finish.
+        """
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        subscription = Subscription(self.buffer_size)
+        self._subscribers.add(subscription)
+        metrics.inc("catalog_stream_clients")
+        deadline = loop.time() + self.max_age
+        try:
+            yield f"retry: {RETRY_MS}\n\n".encode()
+            if not last_event_id:
+                subscription.last_sequence = self.sequence
+                # The version lets a fresh page tell whether it loaded an older catalog
+                yield sse_frame("ready", {"version": catalog_cache.etag().strip('"')})
+            elif not self._replay(subscription, last_event_id):
+                subscription.overflowed = True
+
+            while loop.time() < deadline:
+                events = await subscription.next(min(self.heartbeat, max(deadline - loop.time(), 0)))
+                if events is None:
+                    yield HEARTBEAT
+                    continue
+                if subscription.overflowed:
+                    subscription.overflowed = False
+                    yield sse_frame("reset", {
+                        "type": "catalog", "action": "reload", "version": catalog_cache.etag().strip('"')
+                    }, f"{self.instance}-{self.sequence}")
+                    subscription.last_sequence = self.sequence
+                    continue
+                if events:
+                    yield b"".join(event.frame for event in events)
+        finally:
+            self._subscribers.discard(subscription)
+            metrics.inc("catalog_stream_clients", (), -1)
+
+    def metric_families(self):
+        """Event counter for /metrics"""
+        yield "catalog_stream_events_total", "counter", "Catalog change events published", [("", (), self.published)]
+
+
+change_feed = ChangeFeed(
+    buffer_size=CATALOG_STREAM_BUFFER,
+    heartbeat=CATALOG_STREAM_HEARTBEAT,
+    max_age=CATALOG_STREAM_MAX_AGE,
+    max_clients=CATALOG_STREAM_MAX_CLIENTS
+)
+metrics.describe("catalog_stream_clients", "gauge", "Open catalog change streams")
+metrics.describe("catalog_stream_overflows_total", "counter",
+                 "Clients told to reload because their change buffer filled up")
+metrics.add_collector(change_feed.metric_families)
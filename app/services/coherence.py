@@ -0,0 +1,213 @@
+"""
+Coherence - Keep every worker's catalog state current with a shared version
+
+Several uvicorn workers (or hosts) each hold a catalog cache, search index,
+rendered menu page and change stream. Every catalog write bumps a version
+row in the database in the same transaction and records its change events
+under that version. Each worker checks the version row, a single-row
+primary key read, every ``CATALOG_VERSION_CHECK_INTERVAL`` seconds; when
+another worker has written, it replays the recorded events into its own
+state. A write is therefore visible on every worker within one interval.
+"""
+import json
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.config import CATALOG_CHANGE_LOG_SIZE, CATALOG_VERSION_CHECK_INTERVAL
+from app.database import SessionLocal, get_engine, replica_router
+from app.metrics import metrics
+from app.models.models import CatalogChange, CatalogVersion
+from app.services.cache import catalog_cache
+from app.services.change_feed import change_feed
+from app.services.image_service import image_path_index, image_pipeline
+from app.services.search_index import menu_search_index
+
+logger = logging.getLogger("app.coherence")
+
+# Tells other workers to reload everything instead of replaying item changes
+RELOAD = {"type": "catalog", "action": "reload"}
+# Event types sent on to open pages; "image" events only concern workers
+STREAMED_TYPES = ("menu", "category", "catalog")
+
+
+def change(kind: str, action: str, item_id, changes: Optional[Dict] = None) -> Dict:
+    """A change event as recorded in the log and published to open pages"""
+    event = {"type": kind, "action": action, "id": str(item_id)}
+    if changes:
+        event["changes"] = changes
+    return event
+
+
+def commit_catalog_write(db: Session, changes: List[Dict]) -> int:
+    """Commit a catalog write under the next shared version, then apply it locally.
+
+    The version row is updated before anything else is read, so concurrent
+    writers queue on its lock and versions are committed in order.
+    """
+    db.execute(update(CatalogVersion).where(CatalogVersion.id == 1).values(version=CatalogVersion.version + 1))
+    version = db.execute(select(CatalogVersion.version).where(CatalogVersion.id == 1)).scalar_one()
+    db.execute(insert(CatalogChange).values(version=version, changes=json.dumps(changes, ensure_ascii=False)))
+    db.execute(delete(CatalogChange).where(CatalogChange.version <= version - CATALOG_CHANGE_LOG_SIZE))
+    catalog_watcher.commit(db, version)
+
+    catalog_cache.invalidate(version)
+    for event in changes:
+        if event["type"] in STREAMED_TYPES:
+            change_feed.publish(event["type"], event["action"], event.get("id"), event.get("changes"))
+    return version
+
+
+def publish_catalog_change(changes: List[Dict] = ()) -> None:
+    """New shared version for a change outside the database, such as new image variants"""
+    db = SessionLocal()
+    try:
+        commit_catalog_write(db, list(changes))
+    except Exception:
+        logger.exception("Could not bump the shared catalog version; other workers catch up at cache expiry")
+        catalog_cache.invalidate()
+    finally:
+        db.close()
+
+
+class CatalogWatcher:
+    """Polls the shared catalog version and applies other workers' writes"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.seen = 0
+        self.checks = 0
+        self.remote_versions = 0
+        self._written: set = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Adopt the current version and, if enabled, start checking it"""
+        with get_engine().connect() as connection:
+            row = connection.execute(
+                select(CatalogVersion.version, CatalogVersion.epoch).where(CatalogVersion.id == 1)
+            ).one()
+        self.seen = row.version
+        catalog_cache.sync(row.epoch, row.version)
+        if self.interval > 0 and self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="catalog-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def commit(self, db: Session, version: int) -> None:
+        """Commit this worker's write of version, which it applies itself.
+
+        The version is marked as this worker's own before the commit makes
+        it visible, so no check can take it for another worker's write. The
+        lock only covers that bookkeeping, never the database round trip.
+        """
+        with self._lock:
+            self._written.add(version)
+        try:
+            db.commit()
+        except Exception:
+            with self._lock:
+                # The number is free again for another writer's change,
+                # which a check that ran meanwhile would have skipped
+                self._written.discard(version)
+                self.seen = min(self.seen, version - 1)
+            raise
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Catalog version check failed")
+
+    def check(self) -> None:
+        """Apply every version committed since the last check.
+
+        The database is read without the lock held, so a check waiting for a
+        pooled connection never stalls this worker's own writes.
+        """
+        seen = self.seen
+        with get_engine().connect() as connection:
+            version, epoch = connection.execute(
+                select(CatalogVersion.version, CatalogVersion.epoch).where(CatalogVersion.id == 1)
+            ).one()
+            self.checks += 1
+            if epoch != catalog_cache.instance:
+                # The database was recreated; its versions start over
+                with self._lock:
+                    self.seen, self._written = version, set()
+                catalog_cache.sync(epoch, version)
+                menu_search_index.reset()
+                change_feed.reset()
+                return
+            if version <= seen:
+                return
+            rows = connection.execute(
+                select(CatalogChange.version, CatalogChange.changes)
+                .where(CatalogChange.version > seen, CatalogChange.version <= version)
+                .order_by(CatalogChange.version)
+            ).all()
+        with self._lock:
+            if self.seen != seen:
+                # A failed commit moved seen back; read again next time
+                return
+            self.seen = version
+            written, self._written = self._written, {v for v in self._written if v > version}
+
+        remote = [(row.version, json.loads(row.changes)) for row in rows if row.version not in written]
+        complete = [row.version for row in rows] == list(range(seen + 1, version + 1))
+        if not remote and complete:
+            return
+
+        self.remote_versions += len(remote)
+        events = [event for _, changes in remote for event in changes]
+        # Variants written by another worker: read their manifests again,
+        # before the cache is dropped and rebuilt with their srcset
+        if not complete:
+            image_pipeline.forget()
+        # Their writes may refer to files uploaded there since a miss here
+        image_path_index.forget_missing()
+        for event in events:
+            if event["type"] == "image":
+                image_pipeline.forget(event["id"])
+        # Caches refill from the primary until replicas have this write too
+        replica_router.mark_write()
+        catalog_cache.invalidate(version)
+        if not complete or any(event["type"] == "catalog" for event in events):
+            # Missed versions (pruned from the log) or a bulk change: start over
+            menu_search_index.reset()
+            change_feed.reset()
+            return
+        for event in events:
+            if event["type"] not in STREAMED_TYPES:
+                continue
+            if event["type"] == "menu":
+                if event["action"] == "created":
+                    menu_search_index.upsert(event["changes"])
+                elif event["action"] == "updated":
+                    menu_search_index.update(event["id"], event.get("changes", {}))
+                else:
+                    menu_search_index.remove(event["id"])
+            change_feed.publish(event["type"], event["action"], event.get("id"), event.get("changes"))
+
+    def metric_families(self):
+        """Version checks and versions applied from other workers, for /metrics"""
+        yield "catalog_version_checks_total", "counter", "Shared catalog version checks", [("", (), self.checks)]
+        yield ("catalog_remote_versions_total", "counter", "Catalog versions written by other workers and applied",
+               [("", (), self.remote_versions)])
+        yield "catalog_version", "gauge", "Catalog version this worker serves", [("", (), catalog_cache.version)]
+
+
+catalog_watcher = CatalogWatcher(CATALOG_VERSION_CHECK_INTERVAL)
+metrics.add_collector(catalog_watcher.metric_families)
@@ -0,0 +1,49 @@
+"""
+Compression - Precompressed response bodies and Accept-Encoding negotiation
+"""
+import gzip
+from typing import Dict, Optional
+
+import brotli
+
+# Preferred first when the client accepts several equally
+ENCODINGS = ["br", "gzip"]
+
+
+def compress(body: bytes) -> Dict[str, bytes]:
+    """Encode body once per supported encoding, at maximum compression"""
+    return {
+        "br": brotli.compress(body, quality=11),
+        "gzip": gzip.compress(body, compresslevel=9, mtime=0)
+    }
+
+
+def compress_dynamic(body: bytes, encoding: str) -> bytes:
+    """Encode a per-request body at a level cheap enough to run on every response"""
+    if encoding == "br":
+        return brotli.compress(body, quality=4)
+    return gzip.compress(body, compresslevel=6)
+
+
+def negotiate(accept_encoding: Optional[str], available=ENCODINGS) -> Optional[str]:
+    """Pick the encoding to send for an Accept-Encoding header, or None for identity"""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+
+    best, best_weight = None, 0.0
+    for encoding in available:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
@@ -0,0 +1,308 @@
+"""
+Image Service - Image lookup and background generation of resized variants
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+
+from app.config import (
+    CATALOG_CACHE_TTL, IMAGE_DIRS, IMAGE_MISS_TTL, IMAGE_VARIANT_WIDTHS, IMAGE_WORKERS, IMAGE_WEBP_QUALITY,
+    IMAGE_JPEG_QUALITY, UPLOAD_DIR
+)
+
+MANIFEST_SUFFIX = ".variants.json"
+# Menus refer to uploads by the path the upload route returns
+UPLOADED_IMAGE_PREFIX = "static/uploads/"
+# Missing names remembered at most; the set starts over when full
+MAX_MISSING_IMAGES = 4096
+
+
+def manifest_path(image_path: str) -> str:
+    """Path of the manifest recording the variants of image_path"""
+    return os.path.splitext(image_path)[0] + MANIFEST_SUFFIX
+
+
+def upload_url(path: str) -> str:
+    """Path menus and pages use for a file in the upload directory"""
+    return UPLOADED_IMAGE_PREFIX + os.path.basename(path)
+
+
+class ImagePathIndex:
+    """Map of image file name to its path and stat result.
+
+    Built once by scanning ``IMAGE_DIRS`` and then kept current by uploads,
+    finished variant jobs and deletions, so serving an image costs no
+    filesystem lookups. When a name is in more than one directory the
+    earlier directory wins. Names missing from the index (for example files
+    written by another worker process) are looked up on disk and added.
+
+    A name found nowhere is remembered for ``IMAGE_MISS_TTL`` seconds, so
+    repeated requests for it (a placeholder path, a deleted upload) cost no
+    ``os.stat`` calls. Adding the file, or ``forget_missing()`` when another
+    worker writes, makes it visible again at once.
+    """
+
+    def __init__(self, directories: List[str]):
+        self.directories = directories
+        self._entries: Dict[str, Tuple[str, os.stat_result]] = {}
+        # Names found in no directory, and when to look for them again
+        self._missing: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def build(self) -> None:
+        """Scan the image directories"""
+        entries = {}
+        for directory in reversed(self.directories):
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if entry.is_file() and not entry.name.startswith("."):
+                            entries[entry.name] = (os.path.join(directory, entry.name), entry.stat())
+            except OSError:
+                continue
+        with self._lock:
+            self._entries = entries
+            self._missing = {}
+
+    def lookup(self, filename: str) -> Optional[Tuple[str, os.stat_result]]:
+        """(path, stat) for filename, or None if no directory has it"""
+        found = self._entries.get(filename)
+        if found is not None:
+            return found
+        if self._missing.get(filename, 0.0) > time.monotonic():
+            return None
+        for directory in self.directories:
+            path = os.path.join(directory, filename)
+            try:
+                stat_result = os.stat(path)
+            except (OSError, ValueError):
+                continue
+            return self.add(path, stat_result)
+        with self._lock:
+            if len(self._missing) >= MAX_MISSING_IMAGES:
+                self._missing = {}
+            self._missing[filename] = time.monotonic() + IMAGE_MISS_TTL
+        return None
+
+    def add(self, path: str, stat_result: Optional[os.stat_result] = None) -> Tuple[str, os.stat_result]:
+        """Record a file that was just written"""
+        entry = (path, stat_result or os.stat(path))
+        with self._lock:
+            self._entries[os.path.basename(path)] = entry
+            self._missing.pop(os.path.basename(path), None)
+        return entry
+
+    def forget_missing(self) -> None:
+        """Look names remembered as missing up on disk again"""
+        with self._lock:
+            self._missing = {}
+
+    def discard(self, path: str) -> None:
+        """Forget a file that was just deleted"""
+        with self._lock:
+            entry = self._entries.get(os.path.basename(path))
+            if entry is not None and entry[0] == path:
+                del self._entries[os.path.basename(path)]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def generate_variants(image_path: str, widths: Dict[str, int], webp_quality: int,
+                      jpeg_quality: int) -> Dict:
+    """Write WebP and JPEG variants of image_path next to it (runs in a worker process).
+
+    Images narrower than a variant are re-encoded at their own width rather
+    than upscaled. The manifest is written last, so it only ever lists
+    variants that exist on disk. It records them by URL path
+    (``UPLOADED_IMAGE_PREFIX`` + name), never by their place on disk.
+    """
+    from PIL import Image, ImageOps
+
+    stem = os.path.splitext(image_path)[0]
+    variants = {}
+    with Image.open(image_path) as original:
+        # Phone photos are stored sideways with an EXIF rotation tag
+        image = ImageOps.exif_transpose(original)
+        has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+        for name, width in widths.items():
+            resized = image
+            if image.width > width:
+                height = max(1, round(image.height * width / image.width))
+                resized = image.resize((width, height), Image.LANCZOS)
+
+            webp = f"{stem}_{name}.webp"
+            resized.save(webp, "WEBP", quality=webp_quality, method=4)
+
+            jpeg = f"{stem}_{name}.jpg"
+            if has_alpha:
+                flat = Image.new("RGB", resized.size, (255, 255, 255))
+                flat.paste(resized, mask=resized.getchannel("A"))
+                resized = flat
+            resized.save(jpeg, "JPEG", quality=jpeg_quality, optimize=True, progressive=True)
+
+            variants[name] = {"width": resized.width, "webp": upload_url(webp), "jpeg": upload_url(jpeg)}
+
+    manifest = {"source": upload_url(image_path), "variants": variants}
+    target = manifest_path(image_path)
+    with open(target + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(target + ".tmp", target)
+    return manifest
+
+
+class ImagePipeline:
+    """Process pool that turns uploads into resized variants.
+
+    ``enqueue()`` returns immediately; encoding happens in worker processes.
+    When a job finishes its manifest is remembered and the catalog cache is
+    invalidated, so the next catalog read picks up the new ``srcset``.
+    Manifests written by other processes are found on disk on first lookup.
+
+    Only uploads (stored under ``UPLOADED_IMAGE_PREFIX``, kept in
+    ``upload_dir``) get variants, so other images are never looked up. An
+    upload without a manifest is remembered as such, so catalog rebuilds
+    do not retry the file every time, until its job finishes here, another
+    worker reports it finished (``forget()``) or ``CATALOG_CACHE_TTL``
+    seconds pass.
+    """
+
+    def __init__(self, workers: int = 2, upload_dir: str = UPLOAD_DIR):
+        self.workers = workers
+        self.upload_dir = upload_dir
+        self._upload_prefix = os.path.join(upload_dir, "")
+        self.processed = 0
+        self.failed = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._manifests: Dict[str, Dict] = {}
+        # Uploads without a manifest, and when to look for one again
+        self._missing: Dict[str, float] = {}
+        self._pending: set = set()
+        self._lock = threading.Lock()
+
+    def enqueue(self, image_path: str) -> None:
+        """Schedule variant generation for an uploaded image"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            self._pending.add(image_path)
+            future = self._executor.submit(
+                generate_variants, image_path, IMAGE_VARIANT_WIDTHS,
+                IMAGE_WEBP_QUALITY, IMAGE_JPEG_QUALITY
+            )
+        future.add_done_callback(partial(self._finished, image_path))
+
+    def _finished(self, image_path: str, future: Future) -> None:
+        try:
+            manifest = future.result()
+        except Exception:
+            with self._lock:
+                self._pending.discard(image_path)
+                self.failed += 1
+            return
+
+        with self._lock:
+            self._pending.discard(image_path)
+            self._manifests[image_path] = manifest
+            self._missing.pop(image_path, None)
+            self.processed += 1
+        for variant in manifest["variants"].values():
+            image_path_index.add(self.upload_file(variant["webp"]))
+            image_path_index.add(self.upload_file(variant["jpeg"]))
+        # Cached menus (on every worker) carry srcset values for this image
+        from app.services.coherence import change, publish_catalog_change
+        publish_catalog_change([change("image", "variants", image_path)])
+
+    def upload_file(self, image_path: Optional[str]) -> Optional[str]:
+        """File in upload_dir for an uploaded image path, None for any other image"""
+        if not image_path:
+            return None
+        if image_path.startswith(UPLOADED_IMAGE_PREFIX):
+            return os.path.join(self.upload_dir, image_path[len(UPLOADED_IMAGE_PREFIX):])
+        if image_path.startswith(self._upload_prefix):
+            return image_path
+        return None
+
+    def variants(self, image_path: Optional[str]) -> Optional[Dict]:
+        """Variants recorded for image_path, or None if there are none (yet)"""
+        image_path = self.upload_file(image_path)
+        if image_path is None:
+            return None
+        manifest = self._manifests.get(image_path)
+        if manifest is None:
+            if self._missing.get(image_path, 0.0) > time.monotonic():
+                return None
+            try:
+                with open(manifest_path(image_path)) as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                self._missing[image_path] = time.monotonic() + CATALOG_CACHE_TTL
+                return None
+            self._manifests[image_path] = manifest
+            self._missing.pop(image_path, None)
+        return manifest["variants"]
+
+    def forget(self, image_path: Optional[str] = None) -> None:
+        """Read image_path's manifest again on next use (every missing one without a path)"""
+        with self._lock:
+            if image_path is None:
+                self._missing.clear()
+                return
+            image_path = self.upload_file(image_path) or image_path
+            self._manifests.pop(image_path, None)
+            self._missing.pop(image_path, None)
+
+    def srcset(self, image_path: Optional[str]) -> Optional[Dict[str, str]]:
+        """srcset attribute values for image_path, keyed by format"""
+        variants = self.variants(image_path)
+        if not variants:
+            return None
+        srcset = {}
+        for fmt in ("webp", "jpeg"):
+            # Small originals give several variants of the same width
+            by_width = {}
+            for variant in variants.values():
+                # Manifests written before they held URL paths held file paths
+                by_width.setdefault(variant["width"], upload_url(variant[fmt]))
+            srcset[fmt] = ", ".join(f"{path} {width}w" for width, path in sorted(by_width.items()))
+        return srcset
+
+    def remove(self, image_path: str) -> None:
+        """Delete the variants and manifest of image_path"""
+        variants = self.variants(image_path) or {}
+        self.forget(image_path)
+        paths = [manifest_path(self.upload_file(image_path) or image_path)]
+        for variant in variants.values():
+            paths.extend([self.upload_file(upload_url(variant["webp"])), self.upload_file(upload_url(variant["jpeg"]))])
+        for path in paths:
+            image_path_index.discard(path)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def shutdown(self) -> None:
+        """Wait for queued jobs and stop the worker processes"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def stats(self) -> Dict:
+        """Job counters for monitoring"""
+        return {
+            "pending": len(self._pending),
+            "processed": self.processed,
+            "failed": self.failed,
+            "workers": self.workers
+        }
+
+
+image_path_index = ImagePathIndex(IMAGE_DIRS)
+image_pipeline = ImagePipeline(workers=IMAGE_WORKERS)
@@ -1,149 +1,405 @@
 """
 Menu Service - Business logic for menu operations
 """
+import base64
 import os
-from typing import List, Dict, Optional
+from typing import Iterator, List, Dict, Optional, Tuple
+from sqlalchemy import func, or_, insert
 from sqlalchemy.orm import Session
-from app.models.models import Menu
-from app.database import SessionLocal
+from app.models.models import Category, Menu
+from app.services.cache import catalog_cache
+from app.services.change_feed import changed_fields
+from app.services.coherence import RELOAD, change, commit_catalog_write
+from app.services.search_index import menu_search_index
+from app.services.image_service import image_pipeline, image_path_index
 
+DEFAULT_IMAGES = ["static/images/default.jpg", "assets/images/default.jpg"]
 
-def get_db_session() -> Session:
-    """Get database session"""
-    return SessionLocal()
 
+def serialize_menu(menu: Menu) -> Dict:
+    """A menu as the API returns it, with srcset values for its image variants"""
+    data = menu.to_dict()
+    data["srcset"] = image_pipeline.srcset(menu.image)
+    return data
 
-def read_menus() -> List[Dict]:
-    """Read all menus from database"""
-    db = get_db_session()
+
+def _load_menus(db: Session) -> List[Dict]:
+    """Load all menus from database"""
+    menus = db.query(Menu).all()
+    return [serialize_menu(menu) for menu in menus]
+
+
+def read_menus(db: Session) -> List[Dict]:
+    """Read all menus (served from the catalog cache)"""
+    menus = catalog_cache.get("menus", lambda: _load_menus(db))
+    return [dict(menu) for menu in menus]
+
+
+def encode_cursor(category_id: int, menu_id: int) -> str:
+    """Encode a (category_id, id) keyset position as an opaque cursor"""
+    raw = f"{category_id}:{menu_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    """Decode a cursor produced by encode_cursor"""
     try:
-        menus = db.query(Menu).all()
-        return [menu.to_dict() for menu in menus]
-    finally:
-        db.close()
+        padded = cursor + "=" * (-len(cursor) % 4)
+        category_id, menu_id = base64.urlsafe_b64decode(padded).decode().split(":")
+        return int(category_id), int(menu_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def query_menus(db: Session, category_id: Optional[str] = None, available: Optional[bool] = None,
+                featured: Optional[bool] = None, min_price: Optional[float] = None,
+                max_price: Optional[float] = None, limit: Optional[int] = None,
+                cursor: Optional[str] = None) -> Dict:
+    """Read menus matching the given filters, one keyset page at a time.
+
+    Results are ordered by (category_id, id). When limit is set and more rows
+    remain, "nextCursor" holds the position to pass back as cursor.
+    Price filters apply to the starting price (min_price).
+    """
+    query = db.query(Menu)
+    if category_id is not None:
+        query = query.filter(Menu.category_id == int(category_id))
+    if available is not None:
+        query = query.filter(Menu.available == available)
+    if featured is not None:
+        query = query.filter(Menu.featured == featured)
+    if min_price is not None:
+        query = query.filter(Menu.min_price >= min_price)
+    if max_price is not None:
+        query = query.filter(Menu.min_price <= max_price)
+    if cursor:
+        after_category, after_id = decode_cursor(cursor)
+        # The leading ">=" gives the planner a range on the paging index; the
+        # equivalent "a > x OR (a = x AND b > y)" makes SQLite scan all of it
+        query = query.filter(
+            Menu.category_id >= after_category,
+            or_(Menu.category_id > after_category, Menu.id > after_id)
+        )
+
+    query = query.order_by(Menu.category_id, Menu.id)
+    if limit is not None:
+        # Fetch one extra row to know whether another page exists
+        query = query.limit(limit + 1)
+
+    menus = query.all()
+    next_cursor = None
+    if limit is not None and len(menus) > limit:
+        menus = menus[:limit]
+        next_cursor = encode_cursor(menus[-1].category_id, menus[-1].id)
+
+    return {"menus": [serialize_menu(menu) for menu in menus], "nextCursor": next_cursor}
 
 
-def get_menu_by_id(menu_id: str) -> Optional[Dict]:
+def search_menus(db: Session, query: str, limit: int = 20,
+                 category_id: Optional[str] = None) -> List[Dict]:
+    """Search menu titles and descriptions using the in-process index"""
+    menu_search_index.ensure_built(lambda: _load_menus(db))
+    return menu_search_index.search(query, limit=limit, category_id=category_id)
+
+
+def get_menu_by_id(db: Session, menu_id: str) -> Optional[Dict]:
     """Get a single menu by ID"""
-    db = get_db_session()
+    menu = db.query(Menu).filter(Menu.id == int(menu_id)).first()
+    return serialize_menu(menu) if menu else None
+
+
+def is_last_image_reference(db: Session, image_path: Optional[str], menu_id: int) -> bool:
+    """Whether menu_id is the only menu using an uploaded image.
+
+    Uploads are stored under their content hash, so several menus can share
+    one file. Checked before committing so the request stays on one
+    connection.
+    """
+    if not image_path or image_path in DEFAULT_IMAGES:
+        return False
+    other = db.query(Menu.id).filter(Menu.image == image_path, Menu.id != menu_id).first()
+    return other is None
+
+
+def remove_image_files(image_path: str) -> None:
+    """Delete an image file and its variants"""
+    # Menus store the URL path of uploads; the file is in UPLOAD_DIR
+    file_path = image_pipeline.upload_file(image_path) or image_path
+    image_path_index.discard(file_path)
     try:
-        menu = db.query(Menu).filter(Menu.id == int(menu_id)).first()
-        return menu.to_dict() if menu else None
-    finally:
-        db.close()
+        os.remove(file_path)
+    except OSError:
+        pass
+    image_pipeline.remove(image_path)
 
 
-def count_menus_by_category(category_id: str) -> int:
+def count_menus_by_category(db: Session, category_id: str) -> int:
     """Count menus in a specific category"""
-    db = get_db_session()
-    try:
-        count = db.query(Menu).filter(Menu.category_id == int(category_id)).count()
-        return count
-    finally:
-        db.close()
+    return db.query(Menu).filter(Menu.category_id == int(category_id)).count()
+
+
+def query_menu_counts(db: Session) -> Dict[str, int]:
+    """Count menus per category with a single GROUP BY query"""
+    rows = (
+        db.query(Menu.category_id, func.count(Menu.id))
+        .group_by(Menu.category_id)
+        .all()
+    )
+    return {str(category_id): count for category_id, count in rows}
 
 
-def get_menu_counts() -> Dict[str, int]:
+def get_menu_counts(db: Session) -> Dict[str, int]:
     """Get menu count for each category"""
-    db = get_db_session()
-    try:
-        menus = db.query(Menu).all()
-        counts = {}
-        for menu in menus:
-            cat_id = str(menu.category_id)
-            counts[cat_id] = counts.get(cat_id, 0) + 1
-        return counts
-    finally:
-        db.close()
+    return dict(catalog_cache.get("menu_counts", lambda: query_menu_counts(db)))
 
 
-def create_menu(title: str, category_id: str, description: str, min_price: float,
+def create_menu(db: Session, title: str, category_id: str, description: str, min_price: float,
                 max_price: Optional[float] = None, promotion_price: Optional[float] = None, 
                 currency: str = "KHR", image: str = "static/images/default.jpg", 
                 available: bool = True, featured: bool = False) -> Dict:
     """Create a new menu item"""
-    db = get_db_session()
-    try:
-        new_menu = Menu(
-            category_id=int(category_id),
-            title=title,
-            description=description,
-            min_price=min_price,
-            max_price=max_price,
-            promotion_price=promotion_price,
-            currency=currency,
-            image=image,
-            available=available,
-            featured=featured
-        )
-        db.add(new_menu)
-        db.commit()
-        db.refresh(new_menu)
-        return new_menu.to_dict()
-    finally:
-        db.close()
+    new_menu = Menu(
+        category_id=int(category_id),
+        title=title,
+        description=description,
+        min_price=min_price,
+        max_price=max_price,
+        promotion_price=promotion_price,
+        currency=currency,
+        image=image,
+        available=available,
+        featured=featured
+    )
+    db.add(new_menu)
+    db.flush()
+    menu = serialize_menu(new_menu)
+    commit_catalog_write(db, [change("menu", "created", menu["id"], menu)])
+    menu_search_index.upsert(menu)
+    return menu
 
 
-def update_menu(menu_id: str, **kwargs) -> Optional[Dict]:
+def update_menu(db: Session, menu_id: str, **kwargs) -> Optional[Dict]:
     """Update an existing menu item"""
-    db = get_db_session()
-    try:
-        menu = db.query(Menu).filter(Menu.id == int(menu_id)).first()
-        
-        if not menu:
-            return None
-        
-        if "title" in kwargs and kwargs["title"] is not None:
-            menu.title = kwargs["title"]
-        if "categoryId" in kwargs and kwargs["categoryId"] is not None:
-            menu.category_id = int(kwargs["categoryId"])
-        if "description" in kwargs and kwargs["description"] is not None:
-            menu.description = kwargs["description"]
-        if "minPrice" in kwargs and kwargs["minPrice"] is not None:
-            menu.min_price = kwargs["minPrice"]
-        if "maxPrice" in kwargs:
-            menu.max_price = kwargs["maxPrice"]
-        if "promotionPrice" in kwargs:
-            menu.promotion_price = kwargs["promotionPrice"]
-        if "currency" in kwargs and kwargs["currency"] is not None:
-            menu.currency = kwargs["currency"]
-        if "image" in kwargs and kwargs["image"] is not None:
-            menu.image = kwargs["image"]
-        if "available" in kwargs and kwargs["available"] is not None:
-            menu.available = kwargs["available"]
-        if "featured" in kwargs and kwargs["featured"] is not None:
-            menu.featured = kwargs["featured"]
-        
-        db.commit()
-        db.refresh(menu)
-        return menu.to_dict()
-    finally:
-        db.close()
-
-
-def delete_menu(menu_id: str) -> bool:
-    """Delete a menu item and its image"""
-    db = get_db_session()
-    try:
-        menu = db.query(Menu).filter(Menu.id == int(menu_id)).first()
-        
-        if not menu:
-            return False
-        
-        # Delete image if it exists
-        image_path = menu.image
-        if image_path and image_path not in ["static/images/default.jpg", "assets/images/default.jpg"]:
-            if os.path.exists(image_path):
-                try:
-                    os.remove(image_path)
-                except:
-                    pass
-        
-        db.delete(menu)
-        db.commit()
-        return True
-    finally:
-        db.close()
+    menu = db.query(Menu).filter(Menu.id == int(menu_id)).first()
+    
+    if not menu:
+        return None
+    
+    before = serialize_menu(menu)
+    if "title" in kwargs and kwargs["title"] is not None:
+        menu.title = kwargs["title"]
+    if "categoryId" in kwargs and kwargs["categoryId"] is not None:
+        menu.category_id = int(kwargs["categoryId"])
+    if "description" in kwargs and kwargs["description"] is not None:
+        menu.description = kwargs["description"]
+    if "minPrice" in kwargs and kwargs["minPrice"] is not None:
+        menu.min_price = kwargs["minPrice"]
+    if "maxPrice" in kwargs:
+        menu.max_price = kwargs["maxPrice"]
+    if "promotionPrice" in kwargs:
+        menu.promotion_price = kwargs["promotionPrice"]
+    if "currency" in kwargs and kwargs["currency"] is not None:
+        menu.currency = kwargs["currency"]
+    released_image = None
+    if "image" in kwargs and kwargs["image"] is not None and kwargs["image"] != menu.image:
+        if is_last_image_reference(db, menu.image, menu.id):
+            released_image = menu.image
+        menu.image = kwargs["image"]
+    if "available" in kwargs and kwargs["available"] is not None:
+        menu.available = kwargs["available"]
+    if "featured" in kwargs and kwargs["featured"] is not None:
+        menu.featured = kwargs["featured"]
+    
+    updated = serialize_menu(menu)
+    commit_catalog_write(db, [change("menu", "updated", updated["id"], changed_fields(before, updated))])
+    menu_search_index.upsert(updated)
+    if released_image:
+        remove_image_files(released_image)
+    return updated
+
 
+def delete_menu(db: Session, menu_id: str) -> bool:
+    """Delete a menu item, and its image if no other menu uses it"""
+    menu = db.query(Menu).filter(Menu.id == int(menu_id)).first()
+    
+    if not menu:
+        return False
     
-    return False
+    image_path = menu.image
+    last_reference = is_last_image_reference(db, image_path, menu.id)
+    db.delete(menu)
+    commit_catalog_write(db, [change("menu", "deleted", menu_id)])
+    menu_search_index.remove(menu_id)
+    if last_reference:
+        remove_image_files(image_path)
+    return True
+
+
+# Request field -> Menu column, for bulk writes and exports
+MENU_FIELDS = {
+    "categoryId": "category_id",
+    "title": "title",
+    "description": "description",
+    "minPrice": "min_price",
+    "maxPrice": "max_price",
+    "promotionPrice": "promotion_price",
+    "currency": "currency",
+    "image": "image",
+    "available": "available",
+    "featured": "featured"
+}
+REQUIRED_CREATE_FIELDS = ["title", "categoryId", "description", "minPrice"]
+# Every inserted row needs the same columns for the INSERT to run as one batch
+CREATE_DEFAULTS = {
+    "max_price": None,
+    "promotion_price": None,
+    "currency": "KHR",
+    "image": "static/images/default.jpg",
+    "available": True,
+    "featured": False
+}
+EXPORT_FIELDS = ["id"] + list(MENU_FIELDS)
+
+
+def _parse_id(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid id: {value!r}")
+
+
+def _menu_values(item: Dict, valid_categories: set) -> Dict:
+    """Column values for the fields present in a bulk item"""
+    values = {}
+    for field, column in MENU_FIELDS.items():
+        if field not in item:
+            continue
+        value = item[field]
+        if field == "categoryId":
+            value = _parse_id(value)
+            if value not in valid_categories:
+                raise ValueError(f"Category not found: {item[field]}")
+        elif value is None and field not in ("maxPrice", "promotionPrice"):
+            continue
+        values[column] = value
+    return values
+
+
+def bulk_write(db: Session, items: List[Dict]) -> Dict:
+    """Apply many creates, updates and deletes in one transaction.
+
+    Each item has an "action" ("create", "update" or "delete"), an "id" for
+    updates and deletes, and the same fields as create_menu/update_menu.
+    Items that fail validation are reported in "errors" by index and
+    skipped; every valid item is written in a single transaction.
+
+    Categories and target menus are loaded with one query each. Creates go
+    out as one executemany INSERT (a multi-row INSERT on MySQL), so their
+    ids are not reported. Updates and deletes are flushed together, and the
+    unit of work batches same-shaped statements.
+    """
+    category_ids, menu_ids = set(), set()
+    for item in items:
+        if "categoryId" in item:
+            try:
+                category_ids.add(int(item["categoryId"]))
+            except (TypeError, ValueError):
+                pass
+        if item.get("action") in ("update", "delete"):
+            try:
+                menu_ids.add(int(item.get("id")))
+            except (TypeError, ValueError):
+                pass
+
+    valid_categories = set()
+    if category_ids:
+        valid_categories = {row[0] for row in db.query(Category.id).filter(Category.id.in_(category_ids))}
+    targets = {}
+    if menu_ids:
+        targets = {menu.id: menu for menu in db.query(Menu).filter(Menu.id.in_(menu_ids))}
+
+    results, errors = [], []
+    new_rows, updated, deleted = [], [], []
+    before = {}
+    deleted_ids = set()
+    released_images = set()
+    for index, item in enumerate(items):
+        action = item.get("action")
+        try:
+            if action == "create":
+                missing = [field for field in REQUIRED_CREATE_FIELDS if item.get(field) is None]
+                if missing:
+                    raise ValueError(f"Missing fields: {', '.join(missing)}")
+                new_rows.append({**CREATE_DEFAULTS, **_menu_values(item, valid_categories)})
+                results.append({"index": index, "action": action})
+            elif action in ("update", "delete"):
+                menu = targets.get(_parse_id(item.get("id")))
+                if menu is None or menu.id in deleted_ids:
+                    raise ValueError(f"Menu not found: {item.get('id')}")
+                if action == "update":
+                    values = _menu_values(item, valid_categories)
+                    before.setdefault(menu.id, serialize_menu(menu))
+                    if "image" in values and values["image"] != menu.image:
+                        released_images.add(menu.image)
+                    for column, value in values.items():
+                        setattr(menu, column, value)
+                    updated.append(menu)
+                else:
+                    released_images.add(menu.image)
+                    db.delete(menu)
+                    deleted.append(menu)
+                    deleted_ids.add(menu.id)
+                results.append({"index": index, "action": action, "id": str(menu.id)})
+            else:
+                raise ValueError(f"Unknown action: {action!r}")
+        except ValueError as e:
+            errors.append({"index": index, "action": action, "error": str(e)})
+
+    db.flush()
+    if new_rows:
+        db.execute(insert(Menu), new_rows)
+
+    # Images no longer used by any menu once this transaction commits
+    released_images -= set(DEFAULT_IMAGES) | {None, ""}
+    if released_images:
+        still_used = {row[0] for row in db.query(Menu.image).filter(Menu.image.in_(released_images))}
+        released_images -= still_used
+
+    changed = {menu.id: serialize_menu(menu) for menu in updated if menu.id not in deleted_ids}
+    if new_rows:
+        # New ids are unknown, so open pages reload the catalog
+        changes = [RELOAD]
+    else:
+        changes = [change("menu", "updated", menu_id, changed_fields(before[menu_id], data))
+                   for menu_id, data in changed.items()]
+        changes += [change("menu", "deleted", menu.id) for menu in deleted]
+    if changes:
+        commit_catalog_write(db, changes)
+    # else every item failed: no new version, so no worker drops its cache
+
+    if new_rows:
+        # ... and the index is rebuilt on the next search
+        menu_search_index.reset()
+    else:
+        for data in changed.values():
+            menu_search_index.upsert(data)
+        for menu in deleted:
+            menu_search_index.remove(str(menu.id))
+    for image_path in released_images:
+        remove_image_files(image_path)
+
+    return {
+        "created": len(new_rows),
+        "updated": len(updated),
+        "deleted": len(deleted),
+        "results": results,
+        "errors": errors
+    }
+
+
+def iter_export_rows(db: Session, batch_size: int = 500) -> Iterator[Dict]:
+    """Yield every menu as an export row, fetching batch_size rows at a time"""
+    query = db.query(Menu).order_by(Menu.id).yield_per(batch_size)
+    for menu in query:
+        data = menu.to_dict()
+        yield {field: data[field] for field in EXPORT_FIELDS}
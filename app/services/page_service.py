@@ -0,0 +1,84 @@
+"""
+Page Service - Public menu page rendered with an embedded catalog snapshot
+"""
+import hashlib
+import threading
+from typing import Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from app.services import catalog_service
+from app.services.compression import ENCODINGS, compress_dynamic
+from app.static_assets import static_files
+
+MENU_TEMPLATE = "templates/frontend/index.html"
+SNAPSHOT_MARKER = "<!-- catalog-snapshot -->"
+
+
+def render_menu_page(template: str, catalog: bytes) -> bytes:
+    """Embed the catalog JSON in the menu page so it renders without an API call"""
+    # "<" is escaped so no menu text can close the script element early
+    payload = catalog.replace(b"<", b"\\u003c")
+    head, _, tail = template.partition(SNAPSHOT_MARKER)
+    return b"".join([
+        head.encode("utf-8"),
+        b'<script id="catalog-snapshot" type="application/json">', payload, b"</script>",
+        tail.encode("utf-8")
+    ])
+
+
+class MenuPage:
+    """The rendered public menu page, rebuilt when the catalog version changes.
+
+    The page and its gzip/brotli encodings are produced once per catalog
+    version and served from memory. They use the fast per-response levels:
+    the render holds the lock every request for the page waits on, and
+    maximum brotli takes seconds on a large catalog.
+
+    The ETag is the catalog ETag plus a digest of the template and the
+    static asset fingerprints. The catalog ETag survives a deploy, so
+    without the digest a browser would keep revalidating HTML that points
+    at asset URLs the new build no longer serves.
+    """
+
+    def __init__(self, template_path: str):
+        self.template_path = template_path
+        self.renders = 0
+        self._template: Optional[str] = None
+        self._template_digest = ""
+        self._page: Optional[Dict] = None
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, etag: str) -> Dict:
+        """Page bodies keyed by encoding ("identity", "br", "gzip") plus "etag".
+
+        etag must be read from the catalog cache before calling, so that a
+        write racing with the render can only leave the page looking older.
+        """
+        page = self._page
+        if page is not None and page["catalogEtag"] == etag:
+            return page
+
+        with self._lock:
+            page = self._page
+            if page is not None and page["catalogEtag"] == etag:
+                return page
+            if self._template is None:
+                with open(self.template_path, encoding="utf-8") as f:
+                    self._template = static_files.rewrite_urls(f.read())
+                digest = hashlib.md5(self._template.encode("utf-8"))
+                digest.update(static_files.version.encode("ascii"))
+                self._template_digest = digest.hexdigest()[:10]
+
+            # The same bytes GET /api/catalog sends
+            catalog, _ = catalog_service.catalog_json(db)
+            body = render_menu_page(self._template, catalog)
+            page = {"identity": body, **{encoding: compress_dynamic(body, encoding) for encoding in ENCODINGS}}
+            page["catalogEtag"] = etag
+            page["etag"] = f'{etag[:-1]}-page-{self._template_digest}"'
+            self._page = page
+            self.renders += 1
+            return page
+
+
+menu_page = MenuPage(MENU_TEMPLATE)
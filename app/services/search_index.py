@@ -0,0 +1,300 @@
+"""
+Search Index - In-process inverted index over menu titles and descriptions
+"""
+import bisect
+import heapq
+import itertools
+import math
+import re
+import threading
+import unicodedata
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Latin letters/digits form words; Khmer is written without spaces between
+# words, so each Khmer run is indexed from every syllable start instead.
+TOKEN_PATTERN = re.compile(r"[0-9a-z\u00c0-\u024f]+|[\u1780-\u17ff\u19e0-\u19ff]+")
+KHMER_SYLLABLE_START = re.compile(r"(?<!\u17d2)[\u1780-\u17b3]")
+MAX_KHMER_TERM = 24
+EMPTY = frozenset()
+
+TITLE_WEIGHT = 3.0
+DESCRIPTION_WEIGHT = 1.0
+MAX_QUERY_TOKENS = 6
+PREFIX_CACHE_SIZE = 1024
+# Below this many candidates every match is scored directly
+DIRECT_SCORING_LIMIT = 128
+
+
+def _is_khmer(token: str) -> bool:
+    return "\u1780" <= token[0] <= "\u19ff"
+
+
+def tokenize(text: str, query: bool = False) -> List[str]:
+    """Split text into lowercase index terms (or query prefixes)"""
+    if not text:
+        return []
+    text = unicodedata.normalize("NFC", text).lower()
+    terms = []
+    for token in TOKEN_PATTERN.findall(text):
+        if not _is_khmer(token):
+            terms.append(token)
+            continue
+        if query:
+            # The leading suffix already finds the run wherever it starts
+            terms.append(token[:MAX_KHMER_TERM])
+            continue
+        # Index every syllable-start suffix so that prefix lookups also
+        # find words in the middle of an unspaced Khmer run
+        for match in KHMER_SYLLABLE_START.finditer(token):
+            terms.append(token[match.start():match.start() + MAX_KHMER_TERM])
+    return terms
+
+
+class SearchIndex:
+    """Inverted index mapping terms to the menus that contain them.
+
+    Each term keeps two posting sets: every menu containing it, and the menus
+    containing it in the title. Query matching is done with set intersections
+    so the per-query work stays in C even for very common terms.
+
+    The index is built from the database on first use and then kept current
+    by ``upsert()``/``remove()`` calls from the menu service, so writes cost
+    a handful of set updates instead of a rebuild.
+    """
+
+    def __init__(self):
+        self._any: Dict[str, set] = {}
+        self._title: Dict[str, set] = {}
+        self._terms: List[str] = []
+        self._doc_terms: Dict[int, Iterable[str]] = {}
+        self._docs: Dict[int, Dict] = {}
+        # (title, id) of each menu: the order of equally scored results
+        self._tie_keys: Dict[int, Tuple[str, int]] = {}
+        # Every menu id sorted by tie key, so ties can be taken in order
+        self._tie_order: List[int] = []
+        self._categories: Dict[str, set] = {}
+        self._prefix_cache: Dict[str, Tuple[set, set]] = {}
+        self._built = False
+        self._lock = threading.RLock()
+
+    def ensure_built(self, loader: Callable[[], List[Dict]]) -> None:
+        """Build the index from loader() if it has not been built yet"""
+        if self._built:
+            return
+        with self._lock:
+            if self._built:
+                return
+            for menu in loader():
+                self._add(menu)
+            # Sorted once here; later writes insert into the sorted order
+            self._tie_order = sorted(self._tie_keys, key=self._tie_keys.__getitem__)
+            self._built = True
+
+    def reset(self) -> None:
+        """Drop the index so the next query rebuilds it"""
+        with self._lock:
+            self._any.clear()
+            self._title.clear()
+            self._terms.clear()
+            self._doc_terms.clear()
+            self._docs.clear()
+            self._tie_keys.clear()
+            self._tie_order.clear()
+            self._categories.clear()
+            self._prefix_cache.clear()
+            self._built = False
+
+    def upsert(self, menu: Dict) -> None:
+        """Add or replace a menu in the index"""
+        with self._lock:
+            if not self._built:
+                return
+            self._remove(int(menu["id"]))
+            self._add(menu)
+
+    def update(self, menu_id: str, changes: Dict) -> None:
+        """Apply changed fields to an indexed menu"""
+        with self._lock:
+            menu = self._docs.get(int(menu_id))
+            if menu is not None:
+                self._remove(int(menu_id))
+                self._add({**menu, **changes})
+
+    def remove(self, menu_id: str) -> None:
+        """Remove a menu from the index"""
+        with self._lock:
+            if self._built:
+                self._remove(int(menu_id))
+
+    def _add(self, menu: Dict) -> None:
+        self._prefix_cache.clear()
+        doc_id = int(menu["id"])
+        title_terms = set(tokenize(menu.get("title", "")))
+        all_terms = title_terms.union(tokenize(menu.get("description", "")))
+
+        for term in all_terms:
+            docs = self._any.get(term)
+            if docs is None:
+                docs = self._any[term] = set()
+                bisect.insort(self._terms, term)
+            docs.add(doc_id)
+        for term in title_terms:
+            self._title.setdefault(term, set()).add(doc_id)
+
+        self._doc_terms[doc_id] = tuple(all_terms)
+        self._docs[doc_id] = menu
+        tie_key = self._tie_keys[doc_id] = (menu.get("title", ""), doc_id)
+        if self._built:
+            position = bisect.bisect_left(self._tie_order, tie_key, key=self._tie_keys.__getitem__)
+            self._tie_order.insert(position, doc_id)
+        self._categories.setdefault(menu.get("categoryId"), set()).add(doc_id)
+
+    def _remove(self, doc_id: int) -> None:
+        self._prefix_cache.clear()
+        for term in self._doc_terms.pop(doc_id, ()):
+            docs = self._any[term]
+            docs.discard(doc_id)
+            if not docs:
+                del self._any[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+            title_docs = self._title.get(term)
+            if title_docs is not None:
+                title_docs.discard(doc_id)
+                if not title_docs:
+                    del self._title[term]
+        tie_key = self._tie_keys.get(doc_id)
+        if tie_key is not None and self._built:
+            del self._tie_order[bisect.bisect_left(self._tie_order, tie_key, key=self._tie_keys.__getitem__)]
+        self._tie_keys.pop(doc_id, None)
+        menu = self._docs.pop(doc_id, None)
+        if menu is not None:
+            self._categories[menu.get("categoryId")].discard(doc_id)
+
+    def _expand(self, token: str) -> List[str]:
+        """Every index term starting with token"""
+        terms = self._terms
+        start = bisect.bisect_left(terms, token)
+        end = bisect.bisect_left(terms, token + "\uffff", start)
+        return terms[start:end]
+
+    def _postings(self, token: str) -> Tuple[set, set]:
+        """Union of (any, title) postings over every expansion of token"""
+        cached = self._prefix_cache.get(token)
+        if cached is not None:
+            return cached
+
+        terms = self._expand(token)
+        if len(terms) == 1:
+            return self._any[terms[0]], self._title.get(terms[0], EMPTY)
+        matched = set().union(*(self._any[term] for term in terms))
+        in_title = set().union(*(self._title.get(term, EMPTY) for term in terms))
+
+        # Short prefixes expand to many terms; keep their unions until the
+        # next write instead of rebuilding them for every keystroke
+        if len(self._prefix_cache) >= PREFIX_CACHE_SIZE:
+            self._prefix_cache.clear()
+        self._prefix_cache[token] = (matched, in_title)
+        return matched, in_title
+
+    def search(self, query: str, limit: int = 20, category_id: Optional[str] = None) -> List[Dict]:
+        """Return menus matching every query token (as a prefix), best first.
+
+        A token weighs more when it is rarer and when it matches the title
+        rather than only the description.
+        """
+        tokens = list(dict.fromkeys(tokenize(query, query=True)))[:MAX_QUERY_TOKENS]
+        if not tokens:
+            return []
+
+        with self._lock:
+            total = len(self._docs) or 1
+            postings = [self._postings(token) for token in tokens]
+            if any(not matched for matched, _ in postings):
+                return []
+
+            postings.sort(key=lambda pair: len(pair[0]))
+            candidates = postings[0][0]
+            if len(postings) > 1:
+                candidates = candidates.intersection(*(matched for matched, _ in postings[1:]))
+            if category_id is not None:
+                candidates = candidates & self._categories.get(category_id, EMPTY)
+            if not candidates:
+                return []
+
+            idfs = [math.log(1 + total / len(matched)) for matched, _ in postings]
+            if len(candidates) <= DIRECT_SCORING_LIMIT:
+                ranked = self._rank_direct(candidates, postings, idfs, limit)
+            else:
+                ranked = self._rank_by_pattern(candidates, postings, idfs, limit)
+
+            docs = self._docs
+            return [dict(docs[doc_id], score=round(score, 4)) for doc_id, score in ranked]
+
+    def _rank_direct(self, candidates, postings, idfs, limit) -> List[Tuple[int, float]]:
+        """Score each candidate individually"""
+        scored = []
+        for doc_id in candidates:
+            score = 0.0
+            for (_, in_title), idf in zip(postings, idfs):
+                score += idf * (TITLE_WEIGHT if doc_id in in_title else DESCRIPTION_WEIGHT)
+            scored.append((-score, self._tie_keys[doc_id], doc_id))
+        return [(doc_id, -score) for score, _, doc_id in heapq.nsmallest(limit, scored)]
+
+    def _rank_by_pattern(self, candidates, postings, idfs, limit) -> List[Tuple[int, float]]:
+        """Rank large candidate sets without scoring every document.
+
+        All candidates that match the same subset of tokens in the title have
+        the same score, so subsets are visited best first and members of each
+        score are taken, in tie-break order, until the limit is reached.
+        """
+        scores: Dict[float, List[Tuple[bool, ...]]] = {}
+        for flags in itertools.product((True, False), repeat=len(postings)):
+            score = 0.0
+            for in_title, idf in zip(flags, idfs):
+                score += idf * (TITLE_WEIGHT if in_title else DESCRIPTION_WEIGHT)
+            scores.setdefault(score, []).append(flags)
+
+        ranked = []
+        for score in sorted(scores, reverse=True):
+            # Subsets with equal scores are merged so their ties interleave
+            groups = []
+            for flags in scores[score]:
+                group = candidates
+                for (_, in_title), title_match in zip(postings, flags):
+                    group = group & in_title if title_match else group - in_title
+                    if not group:
+                        break
+                if group:
+                    groups.append(group)
+            if not groups:
+                continue
+            tied = groups[0] if len(groups) == 1 else set().union(*groups)
+            taken = self._first_tied(tied, limit - len(ranked))
+            ranked.extend((doc_id, score) for doc_id in taken)
+            if len(ranked) >= limit:
+                break
+        return ranked
+
+    def _first_tied(self, tied: set, needed: int) -> List[int]:
+        """The first needed members of tied in tie-break order.
+
+        Small sets are sorted. Large ones are intersected with consecutive
+        slices of the presorted ids, each sized to hold about twice needed
+        members, so a tie of thousands usually costs one C-level
+        intersection and a sort of its few matches.
+        """
+        order = self._tie_order
+        tie_key = self._tie_keys.__getitem__
+        if needed * len(order) > 16 * len(tied) * len(tied):
+            return sorted(tied, key=tie_key)[:needed]
+
+        step = max(64, 2 * needed * len(order) // len(tied))
+        taken = []
+        for start in range(0, len(order), step):
+            taken.extend(sorted(tied.intersection(order[start:start + step]), key=tie_key))
+            if len(taken) >= needed:
+                break
+        return taken[:needed]
+
+
+menu_search_index = SearchIndex()
@@ -0,0 +1,64 @@
+"""
+Serialization - Catalog responses encoded to JSON bytes with reusable item fragments
+"""
+from typing import Dict, List, Tuple
+
+import orjson
+
+from app.metrics import metrics
+
+
+def encode(value) -> bytes:
+    """Compact UTF-8 JSON, the same as FastAPI's JSONResponse renders"""
+    return orjson.dumps(value)
+
+
+def json_object(fields: List[Tuple[str, bytes]]) -> bytes:
+    """A JSON object spliced together from already-encoded values"""
+    return b"{" + b",".join(encode(name) + b":" + value for name, value in fields) + b"}"
+
+
+class FragmentEncoder:
+    """Encoded JSON of catalog items, reused while an item is unchanged.
+
+    Each item's bytes are kept next to the dict they were encoded from. When
+    a new catalog version is encoded, only items whose dict differs from the
+    stored one are encoded again, so updating one menu re-encodes that menu
+    and the rest of the body is joined from stored bytes. Fragments of items
+    missing from the latest array are dropped with it.
+
+    Items are keyed by their "id" and must not be mutated after encoding;
+    catalog cache entries never are.
+    """
+
+    def __init__(self):
+        self.encoded = 0
+        self.reused = 0
+        self._fragments: Dict[str, Tuple[Dict, bytes]] = {}
+
+    def array(self, items: List[Dict]) -> bytes:
+        """A JSON array of items"""
+        previous = self._fragments
+        fragments, parts = {}, []
+        for item in items:
+            entry = previous.get(item["id"])
+            if entry is None or entry[0] != item:
+                entry = (item, encode(item))
+                self.encoded += 1
+            else:
+                self.reused += 1
+            fragments[item["id"]] = entry
+            parts.append(entry[1])
+        # Concurrent encodes may each build a map; the last one is kept
+        self._fragments = fragments
+        return b"[" + b",".join(parts) + b"]"
+
+    def metric_families(self):
+        """Fragment encode/reuse counters for /metrics"""
+        yield "catalog_fragments_encoded_total", "counter", "Catalog items encoded to JSON", [("", (), self.encoded)]
+        yield "catalog_fragments_reused_total", "counter", "Catalog items served from an already-encoded fragment", \
+            [("", (), self.reused)]
+
+
+menu_fragments = FragmentEncoder()
+metrics.add_collector(menu_fragments.metric_families)
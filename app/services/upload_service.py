@@ -0,0 +1,93 @@
+"""
+Upload Service - Streaming storage of uploaded images
+"""
+import hashlib
+import os
+import tempfile
+import time
+from typing import Optional, Tuple
+
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+
+from app.config import UPLOAD_DIR, MAX_UPLOAD_SIZE, UPLOAD_CHUNK_SIZE
+from app.metrics import metrics
+
+# File extension for each image type, identified by its leading bytes
+IMAGE_EXTENSIONS = {"jpeg": ".jpg", "png": ".png", "gif": ".gif", "webp": ".webp"}
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds MAX_UPLOAD_SIZE"""
+
+
+class UnsupportedImage(Exception):
+    """Raised when an upload is not a JPEG, PNG, GIF or WebP image"""
+
+
+def sniff_image_type(header: bytes) -> Optional[str]:
+    """Identify an image from its first bytes, ignoring the claimed content type"""
+    if header.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+async def save_upload(image: UploadFile) -> Tuple[str, bool]:
+    """Stream an uploaded image into UPLOAD_DIR under its content hash.
+
+    Returns the file name and whether it is new. Chunks are hashed while
+    they are copied to a temporary file in UPLOAD_DIR, with every blocking
+    read and write done in the threadpool, and the copy stops as soon as the
+    size limit is crossed. Identical content maps to the same name, so a
+    duplicate upload is dropped and the stored copy reused; otherwise the
+    finished file is renamed into place, so a partial upload is never
+    visible under its final name.
+    """
+    started = time.perf_counter()
+    size = 0
+    result = "rejected"
+    fd, temp_path = tempfile.mkstemp(dir=UPLOAD_DIR, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            chunk = await image.read(UPLOAD_CHUNK_SIZE)
+            image_type = sniff_image_type(chunk)
+            if image_type is None:
+                raise UnsupportedImage()
+
+            digest = hashlib.sha256()
+            while chunk:
+                size += len(chunk)
+                if size > MAX_UPLOAD_SIZE:
+                    raise UploadTooLarge()
+                digest.update(chunk)
+                await run_in_threadpool(out.write, chunk)
+                chunk = await image.read(UPLOAD_CHUNK_SIZE)
+
+        filename = f"{digest.hexdigest()[:32]}{IMAGE_EXTENSIONS[image_type]}"
+        filepath = os.path.join(UPLOAD_DIR, filename)
+        if os.path.exists(filepath):
+            os.remove(temp_path)
+            result = "duplicate"
+            return filename, False
+
+        # mkstemp creates the file private to this user
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, filepath)
+        result = "created"
+        return filename, True
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    finally:
+        metrics.inc("upload_bytes_total", value=size)
+        metrics.inc("uploads_total", (("result", result),))
+        metrics.observe("upload_duration_seconds", (("result", result),), time.perf_counter() - started)
@@ -0,0 +1,141 @@
+"""
+Static Assets - Precompressed, fingerprinted static file serving
+"""
+import hashlib
+import os
+import re
+import threading
+from typing import Dict, Iterable
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from app.config import COMPRESSION_MIN_SIZE, STATIC_CACHE_CONTROL, FINGERPRINTED_CACHE_CONTROL, UPLOAD_DIR
+from app.services.compression import compress, negotiate
+
+# Text assets worth compressing and fingerprinting; images are already compressed
+TEXT_ASSET_EXTENSIONS = {".css", ".js", ".html", ".svg", ".json", ".txt"}
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that serves text assets precompressed and fingerprinted.
+
+    ``build()`` walks the directory once at startup. Every text asset gets a
+    content-hashed alias (``css/style.css`` -> ``css/style.<hash>.css``)
+    served with an immutable Cache-Control, and those of at least
+    ``COMPRESSION_MIN_SIZE`` bytes are brotli/gzip encoded into memory and
+    picked by Accept-Encoding. Encoding at maximum compression is slow, so
+    it runs on a background thread and does not hold up startup; until an
+    asset's encodings are ready it is sent uncompressed. Assets edited after
+    startup are served from disk as usual, but their encoded copies and
+    aliases are only refreshed by the next ``build()``.
+
+    Files under ``immutable_dirs`` (uploads, stored under their content
+    hash) never change under their name, so they get the immutable
+    Cache-Control of fingerprinted aliases.
+    """
+
+    def __init__(self, *, directory: str, prefix: str, immutable_dirs: Iterable[str] = (), **kwargs):
+        # Built at import time, so the directory is only checked when serving
+        super().__init__(directory=directory, check_dir=False, **kwargs)
+        self.prefix = prefix
+        root = os.path.abspath(directory)
+        # Request paths under this mount whose files are immutable
+        self._immutable_prefixes = tuple(
+            os.path.relpath(os.path.abspath(path), root).replace(os.sep, "/") + "/"
+            for path in immutable_dirs
+            if os.path.abspath(path).startswith(os.path.join(root, ""))
+        )
+        self._encoded: Dict[str, Dict[str, bytes]] = {}
+        self._compressible: frozenset = frozenset()
+        self._originals: Dict[str, str] = {}
+        self._fingerprints: Dict[str, str] = {}
+        self.version = ""
+
+    def build(self) -> None:
+        """Fingerprint the text assets under the directory and start precompressing them"""
+        pending, originals, fingerprints = {}, {}, {}
+        root = os.path.realpath(self.directory)
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                stem, extension = os.path.splitext(name)
+                if extension.lower() not in TEXT_ASSET_EXTENSIONS or name.startswith("."):
+                    continue
+                full_path = os.path.join(dirpath, name)
+                with open(full_path, "rb") as f:
+                    body = f.read()
+
+                relative = os.path.relpath(full_path, root)
+                digest = hashlib.md5(body).hexdigest()[:10]
+                fingerprinted = os.path.join(os.path.dirname(relative), f"{stem}.{digest}{extension}")
+                originals[fingerprinted] = relative
+                fingerprints[relative.replace(os.sep, "/")] = fingerprinted.replace(os.sep, "/")
+                if len(body) >= COMPRESSION_MIN_SIZE:
+                    pending[full_path] = body
+
+        self._encoded = {}
+        self._compressible = frozenset(pending)
+        self._originals, self._fingerprints = originals, fingerprints
+        # Changes whenever any asset's fingerprint does
+        self.version = hashlib.md5("\n".join(sorted(fingerprints.values())).encode("utf-8")).hexdigest()[:10]
+        threading.Thread(target=self._precompress, args=(self._encoded, pending), daemon=True).start()
+
+    @staticmethod
+    def _precompress(encoded: Dict, pending: Dict) -> None:
+        for full_path, body in pending.items():
+            encoded[full_path] = compress(body)
+
+    def url(self, relative: str) -> str:
+        """Public URL for an asset, fingerprinted when it is known"""
+        return f"{self.prefix}/{self._fingerprints.get(relative, relative)}"
+
+    def rewrite_urls(self, html: str) -> str:
+        """Point src/href attributes under this mount at fingerprinted URLs"""
+        pattern = re.compile(r'((?:src|href)=")' + re.escape(self.prefix) + r'/([^"?#]+)"')
+        return pattern.sub(lambda match: f'{match.group(1)}{self.url(match.group(2))}"', html)
+
+    async def get_response(self, path: str, scope) -> Response:
+        original = self._originals.get(path)
+        response = await super().get_response(original or path, scope)
+        if response.status_code in (200, 304):
+            immutable = original is not None or path.startswith(self._immutable_prefixes)
+            response.headers["Cache-Control"] = FINGERPRINTED_CACHE_CONTROL if immutable else STATIC_CACHE_CONTROL
+        return response
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        encoded = self._encoded.get(str(full_path))
+        if encoded is None:
+            response = super().file_response(full_path, stat_result, scope, status_code)
+            if str(full_path) in self._compressible:
+                # Encodings still being prepared; caches must key on them already
+                response.headers["Vary"] = "Accept-Encoding"
+            return response
+
+        request_headers = Headers(scope=scope)
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        response.headers["Vary"] = "Accept-Encoding"
+        encoding = negotiate(request_headers.get("accept-encoding"))
+        if encoding is None:
+            if self.is_not_modified(response.headers, request_headers):
+                return NotModifiedResponse(response.headers)
+            return response
+
+        # Each encoding is a different representation, so it gets its own tag
+        headers = {
+            "ETag": f'{response.headers["etag"][:-1]}-{encoding}"',
+            "Last-Modified": response.headers["last-modified"],
+            "Content-Encoding": encoding,
+            "Vary": "Accept-Encoding"
+        }
+        encoded_response = Response(
+            content=encoded[encoding], status_code=status_code,
+            media_type=response.media_type, headers=headers
+        )
+        if self.is_not_modified(encoded_response.headers, request_headers):
+            return NotModifiedResponse(encoded_response.headers)
+        return encoded_response
+
+
+static_files = PrecompressedStaticFiles(directory="static", prefix="/static", immutable_dirs=[UPLOAD_DIR])
+admin_files = PrecompressedStaticFiles(directory="templates/admin", prefix="/admin", html=True)
@@ -0,0 +1,100 @@
+"""
+Bulk Import/Export Benchmark
+Compares pushing a seasonal menu one POST /api/menus call at a time against a
+single POST /api/menus/bulk, then times GET /api/menus/export.
+
+The app runs in-process against a temporary SQLite database with an
+artificial per-statement delay standing in for the remote MySQL round trip.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DB_FILE}")
+
+import httpx
+from sqlalchemy import event
+
+from app import create_app
+from app.database import engine, init_db
+
+
+def menu_item(i, category_id):
+    return {
+        "title": f"Seasonal dish {i}",
+        "categoryId": category_id,
+        "description": "Benchmark item",
+        "minPrice": 1000 + i
+    }
+
+
+async def run(app, args):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.post("/api/categories", json={"name": "Seasonal"})
+        category_id = response.json()["category"]["id"]
+
+        started = time.perf_counter()
+        for i in range(args.items):
+            response = await client.post("/api/menus", json=menu_item(i, category_id))
+            response.raise_for_status()
+        single = time.perf_counter() - started
+
+        items = [{"action": "create", **menu_item(i, category_id)} for i in range(args.items)]
+        started = time.perf_counter()
+        response = await client.post("/api/menus/bulk", json={"items": items})
+        response.raise_for_status()
+        bulk = time.perf_counter() - started
+
+        # Bulk creates do not report ids; read them back from the export
+        response = await client.get("/api/menus/export")
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        updates = [{"action": "update", "id": row["id"], "minPrice": 2000} for row in rows[-args.items:]]
+        started = time.perf_counter()
+        response = await client.post("/api/menus/bulk", json={"items": updates})
+        response.raise_for_status()
+        bulk_update = time.perf_counter() - started
+
+        exports = {}
+        for fmt in ("ndjson", "csv"):
+            started = time.perf_counter()
+            response = await client.get(f"/api/menus/export?format={fmt}")
+            response.raise_for_status()
+            exports[fmt] = (time.perf_counter() - started, response.text.count("\n"))
+
+    print(f"{'one POST per item':<24}{args.items / single:>10.1f} items/s{single:>10.2f}s")
+    print(f"{'bulk create':<24}{args.items / bulk:>10.1f} items/s{bulk:>10.2f}s")
+    print(f"{'bulk update':<24}{args.items / bulk_update:>10.1f} items/s{bulk_update:>10.2f}s")
+    for fmt, (elapsed, lines) in exports.items():
+        print(f"{'export ' + fmt:<24}{lines / elapsed:>10.1f} rows/s {elapsed:>10.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=400)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="simulated DB round trip")
+    args = parser.parse_args()
+
+    # Creating the app registers the models before the tables are created
+    app = create_app()
+    init_db()
+    delay = args.latency_ms / 1000
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def simulate_round_trip(*_):
+        time.sleep(delay)
+
+    print(f"items={args.items} simulated latency={args.latency_ms}ms")
+    asyncio.run(run(app, args))
+
+
+if __name__ == "__main__":
+    main()
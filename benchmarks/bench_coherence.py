@@ -0,0 +1,258 @@
+"""
+Coherence Benchmark
+Starts several uvicorn workers on one SQLite database, writes through one
+worker at a time and measures how long the others take to serve the write:
+in the cached catalog, in search results and as an event on their change
+streams.
+
+Each worker is a separate process on its own port, so every request goes to
+a known worker. The run fails (exit status 1) when a worker has not caught up
+with a write within --bound seconds (by default twice the check interval
+plus half a second).
+
+The workers are started together on an empty database, as a fresh
+deployment starts them, so they race to migrate it. --startup-trials more
+rounds of that race run first; every worker must start and all must serve
+the same catalog ETag.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+POLL_SECONDS = 0.02
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_workers(count, env):
+    """count workers started at once, returned when all of them answer"""
+    workers = []
+    for _ in range(count):
+        port = free_port()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning",
+             "--timeout-graceful-shutdown", "2"],
+            cwd=ROOT, env=env
+        )
+        workers.append((process, f"http://127.0.0.1:{port}"))
+    for process, url in workers:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                httpx.get(f"{url}/api/categories").raise_for_status()
+                break
+            except httpx.HTTPError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    stop_workers(workers)
+                    raise RuntimeError(f"worker at {url} did not start")
+                time.sleep(0.1)
+    return workers
+
+
+def stop_workers(workers):
+    for process, _ in workers:
+        process.terminate()
+    for process, _ in workers:
+        process.wait(timeout=30)
+
+
+def worker_env(work_dir, interval):
+    """Environment for workers sharing a new, empty database in work_dir"""
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(work_dir, 'bench.db')}",
+        "UPLOAD_DIR": os.path.join(work_dir, "uploads"),
+        "CATALOG_VERSION_CHECK_INTERVAL": str(interval)
+    })
+    return env
+
+
+def check_concurrent_startup(count, trials, interval):
+    """Start count workers at once on an empty database, trials times.
+
+    Returns the number of failed trials: a worker that crashed while
+    migrating, or workers handing out different ETags (different epochs).
+    """
+    failures = 0
+    for trial in range(trials):
+        try:
+            workers = start_workers(count, worker_env(tempfile.mkdtemp(), interval))
+        except RuntimeError as e:
+            print(f"  startup {trial}: {e}")
+            failures += 1
+            continue
+        try:
+            etags = {httpx.get(f"{url}/api/catalog").headers["etag"] for _, url in workers}
+        finally:
+            stop_workers(workers)
+        if len(etags) != 1:
+            print(f"  startup {trial}: workers disagree on the catalog version: {sorted(etags)}")
+            failures += 1
+    return failures
+
+
+class StreamListener(threading.Thread):
+    """Records when each change event arrives on one worker's stream"""
+
+    def __init__(self, url):
+        super().__init__(daemon=True)
+        self.url = url
+        self.arrivals = []
+        self.ready = threading.Event()
+
+    def run(self):
+        try:
+            with httpx.stream("GET", f"{self.url}/api/catalog/stream", timeout=None) as response:
+                event = None
+                for line in response.iter_lines():
+                    if line.startswith("event: "):
+                        event = line[7:]
+                    elif line.startswith("data: "):
+                        if event == "ready":
+                            self.ready.set()
+                        elif event in ("change", "reset"):
+                            self.arrivals.append((time.perf_counter(), json.loads(line[6:])))
+        except httpx.HTTPError:
+            # The worker was stopped
+            pass
+
+    def arrival(self, menu_id):
+        """When the event for menu_id arrived, if it has"""
+        return next((at for at, event in self.arrivals if event.get("type") == "menu" and event["id"] == menu_id), None)
+
+
+def ms(delay):
+    return "never" if delay is None else f"{delay * 1000:6.0f}ms"
+
+
+def wait_until(check, since, timeout):
+    """Seconds from since until check() is true, or None after timeout"""
+    while time.perf_counter() - since < timeout:
+        if check():
+            return time.perf_counter() - since
+        time.sleep(POLL_SECONDS)
+    return None
+
+
+def observe(client, listener, menu_id, title, deleted, written, timeout):
+    """Delays until the write shows in client's catalog, search results and stream"""
+
+    def cached():
+        menus = {menu["id"]: menu for menu in client.get("/api/catalog").json()["menus"]}
+        if deleted:
+            return menu_id not in menus
+        return menu_id in menus and menus[menu_id]["title"] == title
+
+    def searched():
+        found = [menu["id"] for menu in client.get("/api/menus/search", params={"q": title}).json()["menus"]]
+        return (menu_id in found) != deleted
+
+    def streamed():
+        return listener.arrival(menu_id) is not None
+
+    with ThreadPoolExecutor(3) as pool:
+        delays = list(pool.map(lambda check: wait_until(check, written, timeout), (cached, searched, streamed)))
+    if delays[2] is not None:
+        delays[2] = listener.arrival(menu_id) - written
+    return delays
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--writes", type=int, default=12)
+    parser.add_argument("--interval", type=float, default=0.5, help="CATALOG_VERSION_CHECK_INTERVAL for the workers")
+    parser.add_argument("--bound", type=float, help="seconds every worker must catch up within")
+    parser.add_argument("--startup-trials", type=int, default=3, help="extra concurrent starts on an empty database")
+    args = parser.parse_args()
+    bound = args.bound or args.interval * 2 + 0.5
+
+    failed_starts = check_concurrent_startup(args.workers, args.startup_trials, args.interval)
+    print(f"{args.workers} workers started together on an empty database: "
+          f"{args.startup_trials - failed_starts}/{args.startup_trials} trials ok")
+
+    workers = start_workers(args.workers, worker_env(tempfile.mkdtemp(), args.interval))
+    urls = [url for _, url in workers]
+    try:
+        clients = [httpx.Client(base_url=url) for url in urls]
+        clients[0].post("/api/categories", json={"name": "Soups"}).raise_for_status()
+        category_id = clients[0].get("/api/categories").json()["categories"][0]["id"]
+        listeners = [StreamListener(url) for url in urls]
+        for listener in listeners:
+            listener.start()
+            listener.ready.wait(10)
+
+        print(f"workers={args.workers} writes={args.writes} check interval={args.interval}s bound={bound}s")
+        cache_delays, search_delays, stream_delays, failures = [], [], [], 0
+        menu_id = title = None
+        for i in range(args.writes):
+            writer = i % len(clients)
+            step = i % 3
+            for listener in listeners:
+                listener.arrivals.clear()
+
+            # Warm every worker's cache and search index so stale state would show
+            for client in clients:
+                client.get("/api/catalog")
+                client.get("/api/menus/search", params={"q": "dish"})
+
+            written = time.perf_counter()
+            if step == 0 or menu_id is None:
+                title = f"dish{i}x"
+                response = clients[writer].post("/api/menus", json={
+                    "title": title, "categoryId": category_id, "description": "", "minPrice": 1000
+                })
+                menu_id = response.json()["menu"]["id"]
+                action = "create"
+            elif step == 1:
+                title = f"dish{i}x"
+                response = clients[writer].put(f"/api/menus/{menu_id}", json={"title": title, "available": False})
+                action = "update"
+            else:
+                response = clients[writer].delete(f"/api/menus/{menu_id}")
+                action = "delete"
+            response.raise_for_status()
+            deleted = action == "delete"
+
+            readers = [index for index in range(len(clients)) if index != writer]
+            with ThreadPoolExecutor(len(readers)) as pool:
+                observed = pool.map(lambda index: observe(
+                    clients[index], listeners[index], menu_id, title, deleted, written, bound * 2
+                ), readers)
+            for index, delays in zip(readers, observed):
+                for delay, collected in zip(delays, (cache_delays, search_delays, stream_delays)):
+                    if delay is None or delay > bound:
+                        failures += 1
+                    collected.append(bound * 2 if delay is None else delay)
+                print(f"  write {i:>2} {action:<6} via worker {writer} -> worker {index}: "
+                      f"cache {ms(delays[0])}  search {ms(delays[1])}  stream {ms(delays[2])}")
+
+        for name, delays in (("cache", cache_delays), ("search", search_delays), ("stream", stream_delays)):
+            print(f"{name:<8} median {statistics.median(delays) * 1000:6.0f}ms  max {max(delays) * 1000:6.0f}ms")
+        if failures:
+            print(f"{failures} observation(s) over the {bound}s bound")
+        else:
+            print(f"every worker caught up within the {bound}s bound")
+    finally:
+        stop_workers(workers)
+    if failures or failed_starts:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Concurrency Benchmark
+Compares throughput of the threadpool-backed catalog routes against the old
+pattern of calling blocking database services from `async def` handlers.
+
+The app runs in-process against a temporary SQLite database with an
+artificial per-statement delay standing in for the remote MySQL round trip.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DB_FILE}")
+# Every request must reach the database for the comparison to be meaningful
+os.environ.setdefault("CATALOG_CACHE_TTL", "0")
+
+import httpx
+from fastapi import APIRouter, FastAPI
+from sqlalchemy import event
+
+from app import create_app
+from app.database import SessionLocal, engine, init_db
+from app.services import catalog_service, category_service, menu_service
+
+
+def seed(items):
+    db = SessionLocal()
+    try:
+        category_ids = [category_service.create_category(db, name=f"Category {i}", order=i)["id"]
+                        for i in range(10)]
+        for i in range(items):
+            menu_service.create_menu(
+                db,
+                title=f"Dish {i}",
+                category_id=category_ids[i % len(category_ids)],
+                description="Benchmark item",
+                min_price=1000 + i
+            )
+    finally:
+        db.close()
+
+
+def blocking_app():
+    """The catalog route as it was written before: async def + blocking call"""
+    app = FastAPI()
+    router = APIRouter(prefix="/api")
+
+    @router.get("/catalog")
+    async def get_catalog():
+        db = SessionLocal()
+        try:
+            catalog = catalog_service.read_catalog(db)
+        finally:
+            db.close()
+        return {"success": True, **catalog}
+
+    app.include_router(router)
+    return app
+
+
+async def drive(app, clients, requests_per_client):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker():
+            for _ in range(requests_per_client):
+                response = await client.get("/api/catalog")
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=5, help="requests per client")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="simulated DB round trip")
+    parser.add_argument("--items", type=int, default=50)
+    args = parser.parse_args()
+
+    init_db()
+    seed(args.items)
+
+    delay = args.latency_ms / 1000
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def simulate_round_trip(*_):
+        time.sleep(delay)
+
+    total = args.clients * args.requests
+    print(f"clients={args.clients} requests={total} simulated latency={args.latency_ms}ms")
+    for name, app in [("async def + blocking call", blocking_app()), ("threadpool (def)", create_app())]:
+        elapsed = asyncio.run(drive(app, args.clients, args.requests))
+        print(f"{name:<28}{total / elapsed:>10.1f} req/s{elapsed:>10.2f}s")
+
+
+if __name__ == "__main__":
+    main()
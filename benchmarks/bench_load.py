@@ -0,0 +1,275 @@
+"""
+Load Benchmark
+Drives the catalog, search, upload and image routes with concurrent clients
+against synthetic catalogs of several sizes and reports p50/p95/p99 latency
+and requests/sec per route.
+
+The app runs in-process against a temporary SQLite database (optionally with
+an artificial per-statement delay standing in for the remote MySQL round
+trip). Catalogs are generated from a fixed seed, so runs on different
+commits measure the same data. Results are written as JSON with sorted keys;
+pass an earlier file to --compare to print the change per route.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORK_DIR = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(WORK_DIR, 'bench.db')}")
+# Uploads must not land in the project's static/uploads
+os.environ.setdefault("UPLOAD_DIR", os.path.join(WORK_DIR, "uploads"))
+
+import httpx
+from PIL import Image
+from sqlalchemy import event, insert
+
+from app import create_app
+from app.database import Base, SessionLocal, engine, init_db
+from app.models.models import Category, Menu
+from app.services.cache import catalog_cache
+from app.services.search_index import menu_search_index
+
+WORDS = [
+    "fried", "rice", "noodle", "soup", "beef", "pork", "chicken", "fish", "shrimp",
+    "squid", "crab", "egg", "tofu", "vegetable", "spicy", "sour", "sweet", "grilled",
+    "steamed", "curry", "lemongrass", "garlic", "pepper", "kampot", "coconut", "mango",
+    "lok", "lak", "amok", "kuy", "teav", "សម្ល", "បាយ", "ឆា", "គុយទាវ", "សាច់", "មាន់"
+]
+CATEGORIES = 20
+SEED_BATCH = 5000
+# Distinct images cycled through by the upload scenario; repeats are duplicates
+UPLOAD_IMAGES = 8
+PERCENTILES = (50, 95, 99)
+
+
+def seed(items, rng):
+    """Replace the catalog with items synthetic menus spread over CATEGORIES"""
+    Base.metadata.drop_all(bind=engine)
+    init_db()
+    db = SessionLocal()
+    try:
+        db.execute(insert(Category), [
+            {"name": f"Category {i}", "description": "", "order": i, "active": True}
+            for i in range(CATEGORIES)
+        ])
+        category_ids = [category_id for (category_id,) in db.query(Category.id).order_by(Category.id)]
+        for start in range(0, items, SEED_BATCH):
+            db.execute(insert(Menu), [
+                {
+                    "category_id": category_ids[i % CATEGORIES],
+                    "title": f"{' '.join(rng.choice(WORDS) for _ in range(3))} {i}",
+                    "description": " ".join(rng.choice(WORDS) for _ in range(8)),
+                    "min_price": rng.randrange(1000, 50000, 500),
+                    "currency": "KHR",
+                    "image": "static/images/default.jpg",
+                    "available": rng.random() > 0.1,
+                    "featured": rng.random() < 0.05
+                }
+                for i in range(start, min(start + SEED_BATCH, items))
+            ])
+        db.commit()
+        return category_ids
+    finally:
+        db.close()
+        # The in-process caches still describe the previous catalog
+        catalog_cache.invalidate()
+        menu_search_index.reset()
+
+
+def png_bytes(index):
+    image = Image.new("RGB", (64, 64), ((index * 37) % 256, (index * 91) % 256, 128))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def scenarios(category_ids, uploaded):
+    """Route name -> function(i) returning (method, url, request kwargs)"""
+    images = [png_bytes(i) for i in range(UPLOAD_IMAGES)]
+    return {
+        "GET /api/menus": lambda i: ("GET", "/api/menus", {}),
+        "GET /api/menus?categoryId&limit=50": lambda i: (
+            "GET", f"/api/menus?categoryId={category_ids[i % len(category_ids)]}&limit=50", {}
+        ),
+        "GET /api/categories": lambda i: ("GET", "/api/categories", {}),
+        "GET /api/catalog": lambda i: ("GET", "/api/catalog", {}),
+        "GET /api/menus/search": lambda i: ("GET", f"/api/menus/search?q={WORDS[i % len(WORDS)]}&limit=20", {}),
+        "POST /api/upload": lambda i: ("POST", "/api/upload", {
+            "files": {"image": ("photo.png", images[i % UPLOAD_IMAGES], "image/png")}
+        }),
+        "GET /api/images/{filename}": lambda i: ("GET", f"/api/images/{uploaded[i % len(uploaded)]}", {}),
+        "GET /api/images/{missing}": lambda i: ("GET", "/api/images/missing.jpg", {})
+    }
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an ascending list"""
+    rank = max(1, -(-pct * len(ordered) // 100))
+    return ordered[int(rank) - 1]
+
+
+async def drive(client, request_for, clients, requests, max_seconds):
+    """Send requests across clients concurrent workers, timing each one.
+
+    No new request is started after max_seconds, so the slow full-catalog
+    routes on large catalogs report fewer requests instead of running for
+    hours.
+    """
+    latencies = []
+    errors = 0
+    received = 0
+    counter = iter(range(requests))
+    deadline = time.perf_counter() + max_seconds
+
+    async def worker():
+        nonlocal errors, received
+        for i in counter:
+            if time.perf_counter() > deadline:
+                break
+            method, url, kwargs = request_for(i)
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            received += len(response.content)
+            if response.status_code >= 400 and response.status_code != 404:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    completed = len(latencies)
+    result = {
+        "requests": completed,
+        "errors": errors,
+        "rps": round(completed / elapsed, 1),
+        "meanMs": round(sum(latencies) / completed * 1000, 3),
+        "bytesPerResponse": received // completed
+    }
+    for pct in PERCENTILES:
+        result[f"p{pct}Ms"] = round(percentile(latencies, pct) * 1000, 3)
+    return result
+
+
+async def run_size(app, items, args, rng):
+    category_ids = seed(items, rng)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        uploaded = []
+        for i in range(UPLOAD_IMAGES):
+            response = await client.post("/api/upload", files={"image": ("photo.png", png_bytes(i), "image/png")})
+            response.raise_for_status()
+            uploaded.append(os.path.basename(response.json()["imagePath"]))
+
+        results = {}
+        for name, request_for in scenarios(category_ids, uploaded).items():
+            if args.only and not any(part in name for part in args.only):
+                continue
+            # Warm caches and indexes so every run measures steady state
+            for i in range(min(args.warmup, args.requests)):
+                method, url, kwargs = request_for(i)
+                await client.request(method, url, **kwargs)
+            results[name] = await drive(client, request_for, args.clients, args.requests, args.max_seconds)
+            row = results[name]
+            print(f"  {name:<40}{row['requests']:>6} sent{row['rps']:>10.1f} req/s  p50 {row['p50Ms']:>8.2f}ms  "
+                  f"p95 {row['p95Ms']:>8.2f}ms  p99 {row['p99Ms']:>8.2f}ms  errors {row['errors']}")
+        return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, current):
+    """Print the change in throughput and tail latency per size and route"""
+    print(f"\nchange vs {previous['meta'].get('revision')}:")
+    for size, routes in current["results"].items():
+        for name, row in routes.items():
+            before = previous["results"].get(size, {}).get(name)
+            if before is None:
+                continue
+            rps = (row["rps"] / before["rps"] - 1) * 100 if before["rps"] else 0.0
+            p95 = (row["p95Ms"] / before["p95Ms"] - 1) * 100 if before["p95Ms"] else 0.0
+            print(f"  {size:>7} {name:<40} rps {rps:+7.1f}%  p95 {p95:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100,10000,100000", help="comma-separated catalog sizes")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500, help="requests per route and size")
+    parser.add_argument("--max-seconds", type=float, default=30.0, help="time budget per route and size")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per route first")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="simulated DB round trip")
+    parser.add_argument("--only", nargs="*", help="run only routes whose name contains one of these")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_load.json")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    # Creating the app registers the models before the tables are created
+    app = create_app()
+    if args.latency_ms:
+        delay = args.latency_ms / 1000
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def simulate_round_trip(*_):
+            time.sleep(delay)
+
+    async def run_all():
+        # Startup sizes the threadpool and builds the file indexes
+        await app.router.startup()
+        try:
+            results = {}
+            for items in [int(size) for size in args.sizes.split(",")]:
+                print(f"items={items} clients={args.clients} requests={args.requests} "
+                      f"simulated latency={args.latency_ms}ms")
+                results[str(items)] = await run_size(app, items, args, random.Random(args.seed))
+            return results
+        finally:
+            await app.router.shutdown()
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": engine.dialect.name,
+            "clients": args.clients,
+            "requests": args.requests,
+            "maxSeconds": args.max_seconds,
+            "latencyMs": args.latency_ms,
+            "seed": args.seed
+        },
+        "results": asyncio.run(run_all())
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True, ensure_ascii=False)
+        f.write("\n")
+    print(f"\nwrote {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Search Index Benchmark
+Builds the menu search index over a synthetic catalog and reports query latency
+"""
+import argparse
+import random
+import statistics
+import sys
+import os
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.search_index import SearchIndex
+
+WORDS = [
+    "fried", "rice", "noodle", "soup", "beef", "pork", "chicken", "fish", "shrimp",
+    "squid", "crab", "egg", "tofu", "vegetable", "spicy", "sour", "sweet", "grilled",
+    "steamed", "curry", "lemongrass", "garlic", "pepper", "kampot", "coconut", "mango",
+    "papaya", "salad", "sauce", "lok", "lak", "amok", "kuy", "teav", "num", "banh",
+    "chok", "prahok", "ktis", "samlor", "machu", "kari", "bai", "sach", "chrouk",
+    "iced", "coffee", "tea", "milk", "juice", "lime", "special", "house", "family",
+]
+KHMER_WORDS = ["សម្ល", "ម្ជូរ", "បាយ", "ឆា", "គុយទាវ", "នំបញ្ចុក", "អាម៉ុក", "ឡុកឡាក់", "សាច់", "មាន់"]
+QUERIES = ["rice", "fried rice", "ri", "chick", "beef lok", "kampot pepper", "សម្ល", "បាយ សាច់", "zzz", "curry chicken"]
+
+
+def pseudo_words(rng, count):
+    """Extra vocabulary so common dish words are not in every item"""
+    syllables = ["ba", "cha", "kro", "lo", "ma", "neang", "pho", "sa", "ta", "vong", "ya", "rum"]
+    return ["".join(rng.choice(syllables) for _ in range(rng.randint(2, 3))) for _ in range(count)]
+
+
+def synthetic_menu(rng, menu_id, vocabulary):
+    # Words early in the vocabulary are drawn far more often
+    def word():
+        return vocabulary[int(rng.random() ** 2 * len(vocabulary))]
+
+    title = " ".join(word() for _ in range(3))
+    if rng.random() < 0.3:
+        title += " " + "".join(rng.sample(KHMER_WORDS, 2))
+    description = " ".join(word() for _ in range(rng.randint(5, 12)))
+    return {
+        "id": str(menu_id),
+        "categoryId": str(rng.randint(1, 40)),
+        "title": f"{title} {menu_id}",
+        "description": description,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    vocabulary = WORDS + pseudo_words(rng, 5000)
+    menus = [synthetic_menu(rng, i, vocabulary) for i in range(1, args.items + 1)]
+
+    index = SearchIndex()
+    started = time.perf_counter()
+    index.ensure_built(lambda: menus)
+    build_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for menu_id in range(1, 1001):
+        index.upsert(synthetic_menu(rng, menu_id, vocabulary))
+    upsert_us = (time.perf_counter() - started) / 1000 * 1e6
+
+    print(f"items={args.items} build={build_seconds:.2f}s upsert={upsert_us:.1f}us")
+    # "cold" queries run right after a write, which drops cached prefix unions
+    print(f"{'query':<16}{'matches':>8}{'warm p50':>10}{'warm p99':>10}{'cold p50':>10}")
+    for query in QUERIES:
+        warm, cold = [], []
+        for _ in range(args.rounds):
+            index.upsert(menus[0])
+            started = time.perf_counter()
+            index.search(query, limit=20)
+            cold.append((time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
+            results = index.search(query, limit=20)
+            warm.append((time.perf_counter() - started) * 1000)
+        warm.sort()
+        p99 = warm[min(len(warm) - 1, int(len(warm) * 0.99))]
+        print(f"{query:<16}{len(results):>8}{statistics.median(warm):>10.3f}{p99:>10.3f}"
+              f"{statistics.median(cold):>10.3f}")
+    print("times in milliseconds")
+
+
+if __name__ == "__main__":
+    main()
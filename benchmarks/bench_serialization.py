@@ -0,0 +1,151 @@
+"""
+Serialization Benchmark
+Compares the CPU time per request of the catalog routes serving bodies
+encoded once per catalog version against the old path, which turned the
+cached rows into dicts, ran them through jsonable_encoder and json.dumps on
+every request.
+
+Requests go through the full app in-process with a warm cache, so the
+numbers are the per-request serving cost once the database is out of the
+picture. The rebuild column is the CPU time of the first request after one
+menu is updated, where the new path re-encodes only that menu.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DB_FILE}")
+
+import httpx
+from fastapi import APIRouter, Depends, FastAPI
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app import create_app
+from app.config import COMPRESSION_MIN_SIZE
+from app.database import Base, SessionLocal, engine, get_read_db, init_db
+from app.middleware import JSONCompressionMiddleware
+from app.models.models import Category, Menu
+from app.services import catalog_service, menu_service
+from app.services.cache import catalog_cache
+from app.services.serialization import menu_fragments
+
+CATEGORIES = 12
+SEED_BATCH = 5000
+
+
+def seed(items):
+    """Replace the catalog with items synthetic menus"""
+    Base.metadata.drop_all(bind=engine)
+    init_db()
+    db = SessionLocal()
+    try:
+        db.execute(insert(Category), [
+            {"name": f"Category {i}", "description": "", "order": i, "active": True} for i in range(CATEGORIES)
+        ])
+        category_ids = [category_id for (category_id,) in db.query(Category.id).order_by(Category.id)]
+        for start in range(0, items, SEED_BATCH):
+            db.execute(insert(Menu), [
+                {
+                    "category_id": category_ids[i % CATEGORIES],
+                    "title": f"Dish {i} សម្ល",
+                    "description": "Slow-cooked with lemongrass, galangal and kaffir lime",
+                    "min_price": 1000 + i % 400 * 500,
+                    "currency": "KHR",
+                    "image": "static/images/default.jpg",
+                    "available": i % 10 != 0,
+                    "featured": i % 20 == 0
+                }
+                for i in range(start, min(start + SEED_BATCH, items))
+            ])
+        db.commit()
+    finally:
+        db.close()
+        catalog_cache.invalidate()
+
+
+def previous_app():
+    """The catalog routes as they were: dicts rendered by FastAPI per request"""
+    app = FastAPI()
+    router = APIRouter(prefix="/api")
+
+    @router.get("/catalog")
+    def get_catalog(db: Session = Depends(get_read_db)):
+        catalog = catalog_service.read_catalog(db)
+        return {"success": True, "categories": catalog["categories"], "menus": catalog["menus"],
+                "version": catalog_cache.etag().strip('"')}
+
+    app.include_router(router)
+    app.add_middleware(JSONCompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+    return app
+
+
+async def cpu_per_request(client, path, encoding, requests):
+    """Process CPU time (every thread, the in-process client included) per request"""
+    headers = {"accept-encoding": encoding}
+    (await client.get(path, headers=headers)).raise_for_status()
+    started = time.process_time()
+    for _ in range(requests):
+        (await client.get(path, headers=headers)).raise_for_status()
+    return (time.process_time() - started) / requests
+
+
+async def rebuild_cpu(client, path, encoding):
+    """CPU time of the first request after a single-menu update"""
+    db = SessionLocal()
+    try:
+        menu_id = str(db.query(Menu.id).order_by(Menu.id.desc()).first()[0])
+        menu = menu_service.get_menu_by_id(db, menu_id)
+        menu_service.update_menu(db, menu_id, available=not menu["available"])
+    finally:
+        db.close()
+    started = time.process_time()
+    (await client.get(path, headers={"accept-encoding": encoding})).raise_for_status()
+    return time.process_time() - started
+
+
+async def measure(apps, encodings, requests):
+    results = {}
+    for name, app in apps.items():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for encoding in encodings:
+                per_request = await cpu_per_request(client, "/api/catalog", encoding, requests)
+                rebuild = await rebuild_cpu(client, "/api/catalog", encoding)
+                results[name, encoding] = per_request, rebuild
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100,10000", help="comma-separated catalog sizes")
+    parser.add_argument("--requests", type=int, default=50, help="measured requests per route and encoding")
+    parser.add_argument("--encodings", default="identity,br", help="Accept-Encoding values to compare")
+    args = parser.parse_args()
+    encodings = args.encodings.split(",")
+
+    apps = {"per request": previous_app(), "per version": create_app()}
+    print(f"GET /api/catalog, {args.requests} requests per row, CPU ms per request (all threads)")
+    print(f"{'menus':>8} {'encoding':<10}{'path':<13}{'request':>10}{'rebuild':>10}{'speedup':>9}")
+    for size in (int(size) for size in args.sizes.split(",")):
+        seed(size)
+        encoded_before, reused_before = menu_fragments.encoded, menu_fragments.reused
+        results = asyncio.run(measure(apps, encodings, args.requests))
+        for encoding in encodings:
+            old, new = results["per request", encoding], results["per version", encoding]
+            for name, (per_request, rebuild) in (("per request", old), ("per version", new)):
+                speedup = f"{old[0] / per_request:>8.1f}x" if per_request else f"{'-':>9}"
+                print(f"{size:>8} {encoding:<10}{name:<13}{per_request * 1000:>10.2f}{rebuild * 1000:>10.1f}{speedup}")
+        print(f"{'':>8} menu fragments encoded {menu_fragments.encoded - encoded_before}, "
+              f"reused {menu_fragments.reused - reused_before}")
+
+
+if __name__ == "__main__":
+    main()
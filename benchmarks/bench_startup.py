@@ -0,0 +1,120 @@
+"""
+Startup Benchmark
+Measures how long a fresh worker takes to import the app, run its startup
+handlers and answer its first request, comparing the schema version check
+against the create_all() reflection it replaced.
+
+Every trial runs in a new interpreter, as a worker does on a cold start,
+against a temporary SQLite database with an artificial delay per connection
+and statement standing in for the remote MySQL round trip. The run fails
+(exit status 1) when the median import time exceeds --import-budget-ms.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def child(mode, latency_ms):
+    """One cold start; prints its timings as JSON"""
+    started = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    import main
+    imported = time.perf_counter()
+
+    import asyncio
+    import httpx
+    from sqlalchemy import event
+    from app.database import Base, engine
+    from app.models.models import Category, Menu
+
+    delay = latency_ms / 1000
+    statements = 0
+
+    @event.listens_for(engine, "connect")
+    def simulate_connect(*_):
+        time.sleep(delay)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def simulate_round_trip(*_):
+        nonlocal statements
+        statements += 1
+        time.sleep(delay)
+
+    if mode == "create_all":
+        import app
+
+        # What every startup did before the schema was versioned
+        app.init_db = lambda: Base.metadata.create_all(bind=engine, tables=[Category.__table__, Menu.__table__])
+
+    async def boot():
+        await main.app.router.startup()
+        ready = time.perf_counter(), statements
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            (await client.get("/api/categories")).raise_for_status()
+        await main.app.router.shutdown()
+        return ready
+
+    ready, startup_statements = asyncio.run(boot())
+    first_response = time.perf_counter()
+    print(json.dumps({
+        "importMs": (imported - started) * 1000,
+        "startupMs": (ready - imported) * 1000,
+        "firstResponseMs": (first_response - started) * 1000,
+        "startupStatements": startup_statements
+    }))
+
+
+def run_trials(mode, args, env):
+    trials = []
+    for _ in range(args.trials):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", mode, "--latency-ms", str(args.latency_ms)],
+            capture_output=True, text=True, check=True, env=env, cwd=ROOT
+        ).stdout
+        trials.append(json.loads(output.strip().splitlines()[-1]))
+    return {key: statistics.median(trial[key] for trial in trials) for key in trials[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="simulated DB round trip")
+    parser.add_argument("--import-budget-ms", type=float, default=2000.0)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.latency_ms)
+        return
+
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+    env.setdefault("UPLOAD_DIR", tempfile.mkdtemp())
+    # Stamp the schema once, as a deployed database already is
+    subprocess.run([sys.executable, "-m", "app.schema"], check=True, env=env, cwd=ROOT, capture_output=True)
+
+    print(f"trials={args.trials} simulated latency={args.latency_ms}ms (medians)")
+    print(f"{'':<24}{'import':>10}{'startup':>10}{'first resp':>12}{'statements':>12}")
+    results = {}
+    for mode in ("create_all", "version check"):
+        row = results[mode] = run_trials(mode, args, env)
+        print(f"{mode:<24}{row['importMs']:>8.0f}ms{row['startupMs']:>8.0f}ms"
+              f"{row['firstResponseMs']:>10.0f}ms{row['startupStatements']:>12.0f}")
+
+    import_ms = results["version check"]["importMs"]
+    if import_ms > args.import_budget_ms:
+        print(f"import took {import_ms:.0f}ms, over the {args.import_budget_ms:.0f}ms budget")
+        sys.exit(1)
+    print(f"import within the {args.import_budget_ms:.0f}ms budget")
+
+
+if __name__ == "__main__":
+    main()
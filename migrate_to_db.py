@@ -1,131 +1,271 @@
 """
 Database Migration Script
 Imports existing JSON data into MySQL database
+
+Input files are parsed as a stream, so catalogs of any size run in constant
+memory. Existing names are fetched once up front, rows are inserted in
+batches, and progress is checkpointed after every committed batch so an
+interrupted run resumes where it stopped.
 """
+import argparse
 import json
 import sys
 import os
+import time
+from typing import Dict, Iterator, Optional
 
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from sqlalchemy import insert
+
 from app.database import init_db, SessionLocal
 from app.models.models import Category, Menu
+from app.services.coherence import RELOAD, commit_catalog_write
 from app.config import DATA_FILE, MENUS_FILE
 
+READ_SIZE = 64 * 1024
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_CHECKPOINT = ".migrate_checkpoint.json"
+# Seconds between progress lines
+PROGRESS_INTERVAL = 2.0
 
-def load_json_data():
-    """Load data from JSON files"""
-    categories = []
-    menus = []
-    
-    # Load categories
-    try:
-        with open(DATA_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            categories = data.get("categories", [])
-        print(f"✓ Loaded {len(categories)} categories from {DATA_FILE}")
-    except FileNotFoundError:
-        print(f"⚠ Categories file not found: {DATA_FILE}")
-    
-    # Load menus
-    try:
-        with open(MENUS_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            menus = data.get("menus", [])
-        print(f"✓ Loaded {len(menus)} menus from {MENUS_FILE}")
-    except FileNotFoundError:
-        print(f"⚠ Menus file not found: {MENUS_FILE}")
-    
-    return categories, menus
-
-
-def migrate_categories(db, categories_data):
-    """Migrate categories to database"""
+
+def iter_json_array(path: str, key: str) -> Iterator[Dict]:
+    """Yield the items of the top-level array stored under key, one at a time.
+
+    Accepts either a JSON object such as {"menus": [...]} or NDJSON (one
+    item per line, e.g. the output of GET /api/menus/export).
+    """
+    if path.endswith(".ndjson"):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = ""
+        eof = False
+
+        def fill() -> bool:
+            nonlocal buffer, eof
+            chunk = f.read(READ_SIZE)
+            if not chunk:
+                eof = True
+            buffer += chunk
+            return bool(chunk)
+
+        # Find the array that follows the key
+        marker = json.dumps(key)
+        while True:
+            start = buffer.find(marker)
+            if start >= 0:
+                bracket = buffer.find("[", start + len(marker))
+                if bracket >= 0:
+                    buffer = buffer[bracket + 1:]
+                    break
+            if not fill():
+                return
+
+        pos = 0
+        while True:
+            # Skip whitespace and separators between items
+            while True:
+                while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    break
+                buffer, pos = "", 0
+                fill()
+            if pos >= len(buffer) or buffer[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The item continues past the end of the buffer
+                if eof:
+                    raise
+                buffer = buffer[pos:]
+                pos = 0
+                fill()
+                continue
+            yield item
+            pos = end
+            if pos > READ_SIZE:
+                buffer = buffer[pos:]
+                pos = 0
+
+
+class Checkpoint:
+    """Number of source records already committed, per file"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.done: Dict[str, int] = {}
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.done = json.load(f)
+
+    def get(self, name: str) -> int:
+        return self.done.get(name, 0)
+
+    def save(self, name: str, count: int) -> None:
+        if not self.path:
+            return
+        self.done[name] = count
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.done, f)
+        os.replace(self.path + ".tmp", self.path)
+
+    def clear(self) -> None:
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Progress:
+    """Periodic rows/sec reporting instead of a line per row"""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.read = 0
+        self.inserted = 0
+        self.skipped = 0
+        self.started = time.perf_counter()
+        self._last = self.started
+
+    def report(self, force: bool = False) -> None:
+        now = time.perf_counter()
+        if not force and now - self._last < PROGRESS_INTERVAL:
+            return
+        self._last = now
+        elapsed = max(now - self.started, 1e-9)
+        print(f"  {self.label}: {self.read} read, {self.inserted} inserted, "
+              f"{self.skipped} skipped, {self.read / elapsed:.0f} rows/s")
+
+
+def migrate_categories(db, path: str, batch_size: int) -> Dict:
+    """Migrate categories to database, returning old ID -> new ID"""
     print("\n📋 Migrating categories...")
-    
-    # Create ID mapping from old string IDs to new integer IDs
+    progress = Progress("categories")
+
+    # One query for everything that already exists
+    existing = {name: category_id for category_id, name in db.query(Category.id, Category.name)}
     id_mapping = {}
-    
-    for cat_data in categories_data:
+    # name -> (row, old IDs that map to it)
+    batch: Dict[str, tuple] = {}
+
+    def flush_batch():
+        if not batch:
+            return
+        db.execute(insert(Category), [row for row, _ in batch.values()])
+        created = dict(db.query(Category.name, Category.id).filter(Category.name.in_(list(batch))))
+        db.commit()
+        for name, (_, old_ids) in batch.items():
+            existing[name] = created[name]
+            for old_id in old_ids:
+                id_mapping[old_id] = created[name]
+        progress.inserted += len(batch)
+        batch.clear()
+
+    # Categories are few and their ID mapping is needed for every menu, so
+    # they are always re-read; names that exist are mapped, not re-inserted
+    for cat_data in iter_json_array(path, "categories"):
+        progress.read += 1
         old_id = cat_data.get("id")
-        
-        # Check if category already exists
-        existing = db.query(Category).filter(Category.name == cat_data["name"]).first()
-        if existing:
-            print(f"  ⚠ Category '{cat_data['name']}' already exists, skipping...")
-            id_mapping[old_id] = existing.id
-            continue
-        
-        category = Category(
-            name=cat_data["name"],
-            description=cat_data.get("description", ""),
-            order=cat_data.get("order", 0),
-            active=cat_data.get("active", True)
-        )
-        db.add(category)
-        db.flush()  # Flush to get the ID
-        
-        id_mapping[old_id] = category.id
-        print(f"  ✓ Created category: {category.name} (ID: {old_id} → {category.id})")
-    
-    db.commit()
-    print(f"✓ Migrated {len(categories_data)} categories")
-    
+        name = cat_data["name"]
+        if name in existing:
+            id_mapping[old_id] = existing[name]
+            progress.skipped += 1
+        elif name in batch:
+            batch[name][1].append(old_id)
+            progress.skipped += 1
+        else:
+            batch[name] = ({
+                "name": name,
+                "description": cat_data.get("description", ""),
+                "order": cat_data.get("order", 0),
+                "active": cat_data.get("active", True)
+            }, [old_id])
+            if len(batch) >= batch_size:
+                flush_batch()
+        progress.report()
+
+    flush_batch()
+    progress.report(force=True)
     return id_mapping
 
 
-def migrate_menus(db, menus_data, category_id_mapping):
-    """Migrate menus to database"""
+def migrate_menus(db, path: str, category_id_mapping: Dict, batch_size: int, checkpoint: Checkpoint):
+    """Migrate menus to database in batches, resuming after the last checkpoint"""
     print("\n🍽️  Migrating menus...")
-    
-    migrated_count = 0
-    
-    for menu_data in menus_data:
-        old_category_id = menu_data.get("categoryId")
-        new_category_id = category_id_mapping.get(old_category_id)
-        
-        if not new_category_id:
-            print(f"  ⚠ Skipping menu '{menu_data.get('title')}' - category not found")
+    progress = Progress("menus")
+    resume_from = checkpoint.get("menus")
+    if resume_from:
+        print(f"  ↻ Resuming after {resume_from} already committed records")
+
+    # One query for every existing title instead of one per record
+    existing_titles = {title for (title,) in db.query(Menu.title)}
+    batch = []
+    position = 0
+
+    def flush_batch():
+        if batch:
+            db.execute(insert(Menu), batch)
+        db.commit()
+        progress.inserted += len(batch)
+        batch.clear()
+        checkpoint.save("menus", position)
+
+    for menu_data in iter_json_array(path, "menus"):
+        position += 1
+        if position <= resume_from:
             continue
-        
-        # Check if menu already exists
-        existing = db.query(Menu).filter(Menu.title == menu_data["title"]).first()
-        if existing:
-            print(f"  ⚠ Menu '{menu_data['title']}' already exists, skipping...")
+        progress.read += 1
+
+        new_category_id = category_id_mapping.get(menu_data.get("categoryId"))
+        title = menu_data.get("title")
+        if not new_category_id or not title or title in existing_titles:
+            progress.skipped += 1
             continue
-        
+        existing_titles.add(title)
+
         # Handle both old and new price field names
-        min_price = menu_data.get("minPrice") or menu_data.get("price", 0)
-        max_price = menu_data.get("maxPrice")
-        promotion_price = menu_data.get("promotionPrice")
-        
-        menu = Menu(
-            category_id=new_category_id,
-            title=menu_data["title"],
-            description=menu_data.get("description", ""),
-            min_price=min_price,
-            max_price=max_price,
-            promotion_price=promotion_price,
-            currency=menu_data.get("currency", "KHR"),
-            image=menu_data.get("image", "static/images/default.jpg"),
-            available=menu_data.get("available", True),
-            featured=menu_data.get("featured", False)
-        )
-        db.add(menu)
-        migrated_count += 1
-        print(f"  ✓ Created menu: {menu.title}")
-    
-    db.commit()
-    print(f"✓ Migrated {migrated_count} menus")
+        batch.append({
+            "category_id": new_category_id,
+            "title": title,
+            "description": menu_data.get("description", ""),
+            "min_price": menu_data.get("minPrice") or menu_data.get("price", 0),
+            "max_price": menu_data.get("maxPrice"),
+            "promotion_price": menu_data.get("promotionPrice"),
+            "currency": menu_data.get("currency", "KHR"),
+            "image": menu_data.get("image", "static/images/default.jpg"),
+            "available": menu_data.get("available", True),
+            "featured": menu_data.get("featured", False)
+        })
+        if len(batch) >= batch_size:
+            flush_batch()
+        progress.report()
+
+    flush_batch()
+    progress.report(force=True)
 
 
 def main():
     """Main migration function"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--categories-file", default=DATA_FILE)
+    parser.add_argument("--menus-file", default=MENUS_FILE, help="JSON ({\"menus\": [...]}) or .ndjson")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="progress file used to resume")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args()
+
     print("=" * 60)
     print("🚀 Starting Database Migration")
     print("=" * 60)
-    
+
     # Initialize database (create tables)
     print("\n📦 Creating database tables...")
     try:
@@ -134,28 +274,33 @@ def main():
     except Exception as e:
         print(f"✗ Error creating tables: {e}")
         return
-    
-    # Load JSON data
-    print("\n📂 Loading data from JSON files...")
-    categories_data, menus_data = load_json_data()
-    
-    if not categories_data and not menus_data:
-        print("\n⚠ No data to migrate. Exiting...")
-        return
-    
-    # Start migration
+
+    checkpoint = Checkpoint(args.checkpoint)
+    if args.restart:
+        checkpoint.clear()
+        checkpoint = Checkpoint(args.checkpoint)
+
     db = SessionLocal()
     try:
-        # Migrate categories first
-        category_id_mapping = migrate_categories(db, categories_data)
-        
-        # Migrate menus
-        migrate_menus(db, menus_data, category_id_mapping)
-        
+        category_id_mapping = {}
+        if os.path.exists(args.categories_file):
+            category_id_mapping = migrate_categories(db, args.categories_file, args.batch_size)
+        else:
+            print(f"⚠ Categories file not found: {args.categories_file}")
+
+        if os.path.exists(args.menus_file):
+            migrate_menus(db, args.menus_file, category_id_mapping, args.batch_size, checkpoint)
+        else:
+            print(f"⚠ Menus file not found: {args.menus_file}")
+
+        # Running servers reload the imported catalog
+        commit_catalog_write(db, [RELOAD])
+
         # Show summary
         total_categories = db.query(Category).count()
         total_menus = db.query(Menu).count()
-        
+        checkpoint.clear()
+
         print("\n" + "=" * 60)
         print("✅ Migration completed successfully!")
         print("=" * 60)
@@ -163,9 +308,10 @@ def main():
         print(f"   Categories: {total_categories}")
         print(f"   Menus: {total_menus}")
         print("=" * 60)
-        
+
     except Exception as e:
         print(f"\n✗ Migration failed: {e}")
+        print(f"  Run again to resume from {args.checkpoint}")
         db.rollback()
         raise
     finally:
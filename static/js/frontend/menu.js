@@ -2,6 +2,9 @@ const API_URL = '/api';
 let categories = [];
 let menus = [];
 let filteredMenus = [];
+let catalogVersion = null;
+let catalogStream = null;
+let renderTimer = null;
 
 // ============ INITIALIZATION ============
 
@@ -10,27 +13,97 @@ $(document).ready(function() {
 });
 
 function loadData() {
-  // Load both categories and menus
-  $.when(
-    $.ajax({ url: `${API_URL}/categories`, method: 'GET' }),
-    $.ajax({ url: `${API_URL}/menus`, method: 'GET' })
-  ).done(function(categoriesRes, menusRes) {
-    if (categoriesRes[0].success) {
-      categories = categoriesRes[0].categories;
-      populateCategoryFilter();
-    }
-    
-    if (menusRes[0].success) {
-      menus = menusRes[0].menus;
-      // Filter out unavailable items on initial load
-      filteredMenus = menus.filter(m => m.available !== false);
-      // Create tabs AFTER menus are loaded
-      createCategoryTabs();
-      displayMenu();
-    }
-  }).fail(function() {
-    $('#menuContainer').html('<p class="error-message">Failed to load menu. Please try refreshing the page.</p>');
+  // The server embeds the catalog in the page; fall back to the API without it
+  const snapshot = document.getElementById('catalog-snapshot');
+  if (snapshot) {
+    showCatalog(JSON.parse(snapshot.textContent));
+    return;
+  }
+
+  // Load categories and menus in a single request
+  $.ajax({ url: `${API_URL}/catalog`, method: 'GET' })
+    .done(function(catalogRes) {
+      if (catalogRes.success) {
+        showCatalog(catalogRes);
+      }
+    }).fail(function() {
+      $('#menuContainer').html('<p class="error-message">Failed to load menu. Please try refreshing the page.</p>');
+    });
+}
+
+function showCatalog(catalog) {
+  categories = catalog.categories;
+  populateCategoryFilter();
+
+  menus = catalog.menus;
+  // Filter out unavailable items on initial load
+  filteredMenus = menus.filter(m => m.available !== false);
+  // Create tabs AFTER menus are loaded
+  createCategoryTabs();
+  displayMenu();
+
+  catalogVersion = catalog.version || null;
+  watchCatalog();
+}
+
+// ============ LIVE UPDATES ============
+
+// Apply changes pushed by the server instead of polling the whole catalog
+function watchCatalog() {
+  if (catalogStream || !window.EventSource) return;
+  catalogStream = new EventSource(`${API_URL}/catalog/stream`);
+
+  // Sent on a fresh connection: reload if the page was built from an older catalog
+  catalogStream.addEventListener('ready', function(e) {
+    if (JSON.parse(e.data).version !== catalogVersion) reloadCatalog();
   });
+  catalogStream.addEventListener('change', function(e) {
+    applyChange(JSON.parse(e.data));
+  });
+  // Too many changes were missed to replay them
+  catalogStream.addEventListener('reset', reloadCatalog);
+}
+
+function reloadCatalog() {
+  $.ajax({ url: `${API_URL}/catalog`, method: 'GET' })
+    .done(function(catalogRes) {
+      if (catalogRes.success) {
+        categories = catalogRes.categories;
+        menus = catalogRes.menus;
+        catalogVersion = catalogRes.version;
+        scheduleRender();
+      }
+    });
+}
+
+function applyChange(change) {
+  const list = change.type === 'category' ? categories : menus;
+  const index = list.findIndex(item => String(item.id) === change.id);
+  if (change.action === 'deleted') {
+    if (index !== -1) list.splice(index, 1);
+  } else if (index !== -1) {
+    Object.assign(list[index], change.changes);
+  } else if (change.action === 'created') {
+    list.push(change.changes);
+  }
+  if (change.type === 'category') {
+    categories.sort((a, b) => a.order - b.order);
+  }
+  catalogVersion = change.version;
+  scheduleRender();
+}
+
+// A burst of changes re-renders the page once
+function scheduleRender() {
+  clearTimeout(renderTimer);
+  renderTimer = setTimeout(function() {
+    const selected = $('#categoryFilter').val() || '';
+    populateCategoryFilter();
+    createCategoryTabs();
+    $('.category-tab').removeClass('active');
+    $(`.category-tab[data-category="${selected}"]`).addClass('active');
+    filterMenu();
+  }, 100);
 }
 
 // ============ CATEGORY TABS ============
@@ -118,6 +191,19 @@ function filterMenu() {
   displayMenu();
 }
 
+// Card image, using the resized variants once the server has generated them
+function menuImage(menu) {
+  const img = `<img src="${menu.image}" alt="${menu.title}" loading="lazy" onerror="this.src='/static/images/default.jpg'"`;
+  if (!menu.srcset) {
+    return `${img}>`;
+  }
+  const sizes = '(max-width: 600px) 100vw, 480px';
+  return `<picture>
+            <source type="image/webp" srcset="${menu.srcset.webp}" sizes="${sizes}">
+            ${img} srcset="${menu.srcset.jpeg}" sizes="${sizes}">
+          </picture>`;
+}
+
 function displayMenu() {
   const $container = $('#menuContainer');
   const $emptyState = $('#emptyState');
@@ -183,7 +269,7 @@ function displayMenu() {
     $container.append(`
       <div class="menu-card" data-category="${menu.categoryId}">
         <div class="menu-card-image">
-          <img src="${menu.image}" alt="${menu.title}" onerror="this.src='/static/images/default.jpg'">
+          ${menuImage(menu)}
           ${hasPromotion ? `<span class="discount-badge">-${discount}%</span>` : ''}
           <span class="category-badge">${categoryName}</span>
         </div>